@@ -4,8 +4,9 @@ Funções para ajustar a base de dados nos padrões do FAO 56.
 import numpy as np
 import math
 import pandas as pd
-from datetime import datetime
+import Instrumentacao
 
+@Instrumentacao.medido()
 def conversao_U2(dataset, z=10):
     """
     Conversão da velocidade do vento medida a 10m para 2m com limite de 0.5 m/s.
@@ -14,26 +15,22 @@ def conversao_U2(dataset, z=10):
     :parametro z: altura do anemômetro.
 
     """
-    for i in range(dataset.shape[0]-1): 
-      if np.isnan(dataset.loc[i]) == False:
-        dataset.loc[i] = dataset.loc[i] * (4.87 / math.log(67.8 * z - 5.42)) 
-        if dataset.loc[i] < .5:
-          dataset.loc[i] = .5
-          
+    dataset *= 4.87 / math.log(67.8 * z - 5.42)
+    dataset.clip(lower=.5, inplace=True)
     return dataset
-  
+
+@Instrumentacao.medido()
 def completa_U2(dataset):
     """
       Completa dados faltantes de Velocidade do vento, inserindo 2 m/s.
       :param dataset: coluna de dados de velocidade do vento
 
     """
-    for i in range(dataset.shape[0]-1): 
-      if np.isnan(dataset.loc[i]):
-        dataset.loc[i] = 2
+    dataset.fillna(2, inplace=True)
     return dataset
-  
 
+
+@Instrumentacao.medido()
 def interpola_Temperatura(dataset_Tmax, dataset_Tmin, dataset_Tmean):
     """
     Completa a base de dados em caso de dados faltantes de Temperatura máxima, mínima e média.
@@ -44,26 +41,43 @@ def interpola_Temperatura(dataset_Tmax, dataset_Tmin, dataset_Tmean):
     """
     dataset_Tmax = dataset_Tmax.interpolate(axis = 0)
     dataset_Tmin = dataset_Tmin.interpolate(axis = 0)
-    for i in range(dataset_Tmean.shape[0]-1):
-      if np.isnan(dataset_Tmean[i]):
-        dataset_Tmean[i] = (dataset_Tmax[i] + dataset_Tmin[i])/2
-    
+    dataset_Tmean.fillna((dataset_Tmax + dataset_Tmin)/2, inplace=True)
+
     return dataset_Tmax, dataset_Tmin, dataset_Tmean
-  
-  
+
+
+@Instrumentacao.medido()
 def calcula_dia(dataset):
     """
-      Calcula dia do ano e acrescenta na base de dados
+      Calcula dia do ano e acrescenta na base de dados (coluna J, sem copiar a base).
+      As datas são lidas do índice, se for um DatetimeIndex, ou da primeira coluna no formato 'YYYY-MM-DD'.
       :param dataset: base de dados completa
       :return: base de dados + coluna com o dia do ano
     """
-    date = dataset.iloc[:,0]
-    day_of_year = []
-    for i in range(date.shape[0]):
-      adate = datetime.strptime(date[i],"%Y-%m-%d")
-      day_of_year.append(adate.timetuple().tm_yday)
-    day = np.asarray(day_of_year)
-    dayframe=pd.DataFrame(day,columns=['J'])
-    d = [dataset,dayframe]
-    dataset = pd.concat(d,axis=1)
+    if isinstance(dataset.index, pd.DatetimeIndex):
+      date = dataset.index
+    else:
+      date = pd.DatetimeIndex(pd.to_datetime(dataset.iloc[:,0], format="%Y-%m-%d"))
+    dataset['J'] = np.asarray(date.dayofyear, dtype=np.int64)
     return dataset
+
+
+@Instrumentacao.medido()
+def ajusta_dataset(dataset, z=10, vento='VELOCIDADE_VENTO', tmax='TEMPERATURA_MAXIMA', tmin='TEMPERATURA_MINIMA', tmedia='TEMPERATURA_MEDIA'):
+    """
+      Aplica, em sequência e sobre a própria base de dados, os ajustes do FAO 56:
+      conversão do vento para 2m, preenchimento do vento faltante, interpolação das temperaturas e dia do ano.
+      :param dataset: base de dados completa
+      :param z: altura do anemômetro. Se None, o vento já está a 2m e não é convertido.
+      :param vento: nome da coluna de velocidade do vento.
+      :param tmax: nome da coluna de Temperatura máxima.
+      :param tmin: nome da coluna de Temperatura mínima.
+      :param tmedia: nome da coluna de Temperatura média.
+      :return: base de dados ajustada + coluna com o dia do ano
+    """
+    Instrumentacao.conta('Ajuste.linhas', dataset.shape[0])
+    if z is not None:
+      dataset[vento] = conversao_U2(dataset[vento], z)
+    dataset[vento] = completa_U2(dataset[vento])
+    dataset[tmax], dataset[tmin], dataset[tmedia] = interpola_Temperatura(dataset[tmax], dataset[tmin], dataset[tmedia])
+    return calcula_dia(dataset)
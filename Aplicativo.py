@@ -2,12 +2,121 @@ import streamlit as st
 import numpy as np
 import pandas as pd 
 import math
+import os
 import Calcula_ETo as gse
+import Balanco_Hidrico
+import Carrega_dataset
 from datetime import date
-import matplotlib.pyplot as plt
-from PIL import Image
 import base64
-from IPython.display import HTML
+
+#Bases de dados das estações disponíveis no aplicativo (lidas da pasta local ou, na falta dela, do GitHub)
+PASTA_DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Datasets')
+URL_DATASETS = 'https://raw.githubusercontent.com/Hidrovales/Balanco_Hidrico/main/Datasets/'
+ESTACOES = {
+    'Rio Pardo de Minas': {'arquivo': 'RIO_PARDO_MINAS_AJUSTADO.csv', 'LATITUDE': -15.72305554, 'ALTITUDE': 850.06},
+}
+#: Solar constant [ MJ m-2 min-1]
+GSC = 0.0820
+# Stefan Boltzmann constant [MJ K-4 m-2 dia-1]
+SIGMA = 0.000000004903
+G = 0
+
+
+#Parâmetros das culturas disponíveis no balanço hídrico (FAO 56)
+CULTURAS = {
+    'Milho': {'periodo': {'inicial': 15, 'desenvolvimento': 30, 'media': 60, 'final': 15},
+              'z_etapas': {'inicial': 0.15, 'media': 0.40, 'final': 0.30},
+              'forma_z': {'inicial': True, 'desenvolvimento': False, 'media': True, 'final': False},
+              'kc_etapas': {'inicial': 0.5, 'media': 1.2, 'final': 0.8},
+              'forma_kc': {'inicial': True, 'desenvolvimento': False, 'media': True, 'final': False}},
+}
+#Número máximo de pontos desenhados por gráfico
+MAX_PONTOS = 400
+
+
+def reduz_pontos(df, max_pontos=MAX_PONTOS, soma=False):
+    """
+    Reduz o número de pontos de um dataframe para o gráfico, agrupando linhas consecutivas.
+    :parâmetro df: dataframe indexado pela data.
+    :parâmetro max_pontos: número máximo de pontos.
+    :parâmetro soma: se True, os grupos são somados (totais preservados); senão, é usada a média.
+    :return: dataframe com no máximo max_pontos linhas, indexado pela primeira data de cada grupo.
+    """
+    passo = -(-df.shape[0] // max_pontos)
+    if passo <= 1:
+        return df
+    grupos = df.groupby(np.arange(df.shape[0]) // passo)
+    reduzido = grupos.sum() if soma else grupos.mean()
+    reduzido.index = df.index[::passo]
+    return reduzido
+
+def versao_estacao(nome):
+    """
+    Chave de versão dos dados de uma estação, usada pelos caches: versão da sessão (incrementada pelo botão
+    'Recarregar dados') e data de modificação do arquivo local.
+    :parâmetro nome: nome da estação em ESTACOES.
+    :return: tupla (versão da sessão, data de modificação).
+    """
+    if 'versao_dados' not in st.session_state:
+        st.session_state['versao_dados'] = 0
+    caminho = os.path.join(PASTA_DATASETS, ESTACOES[nome]['arquivo'])
+    modificacao = os.path.getmtime(caminho) if os.path.exists(caminho) else None
+    return st.session_state['versao_dados'], modificacao
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=16)
+def carrega_estacao(nome, versao):
+    """
+    Base de dados de uma estação, lida uma vez por versão e compartilhada entre as sessões (não alterar o retorno).
+    :parâmetro nome: nome da estação em ESTACOES.
+    :parâmetro versao: chave de versão, ver versao_estacao().
+    :return: dataframe da base de dados.
+    """
+    arquivo = ESTACOES[nome]['arquivo']
+    caminho = os.path.join(PASTA_DATASETS, arquivo)
+    if os.path.exists(caminho):
+        df = Carrega_dataset.carrega_dataset(caminho)
+    else:
+        #Mesmo formato de carrega_dataset(): datas convertidas (datetime64) e coluna J
+        df = pd.read_csv(URL_DATASETS + arquivo, delimiter = ',', parse_dates=['DATA'])
+        if 'J' not in df.columns:
+            df['J'] = df['DATA'].dt.dayofyear.astype(np.int64)
+    return df.drop(["Unnamed: 0"], axis=1, errors='ignore')
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=256)
+def simula_balanco_estacao(nome, versao, cultura, theta_fc, theta_wp, p, data):
+    """
+    Balanço hídrico de uma cultura em uma estação, calculado em memória (sem banco de dados) e guardado por parâmetros.
+    :parâmetro nome: nome da estação em ESTACOES.
+    :parâmetro versao: chave de versão, ver versao_estacao().
+    :parâmetro cultura: nome da cultura em CULTURAS.
+    :parâmetro theta_fc: capacidade de campo [m^3 m^3].
+    :parâmetro theta_wp: ponto de murcha [m^3 m^3].
+    :parâmetro p: fator de disponibilidade hídrica [0 - 1].
+    :parâmetro data: data de plantio (datetime.date).
+    :return: dataframe indexado pela data com as séries diárias do balanço (não alterar o retorno).
+    """
+    df = carrega_estacao(nome, versao)
+    eto = serie_eto(nome, versao)
+    P = pd.DataFrame({'DATA': df['DATA'], 'P': df['PRECIPITACAO_TOTAL']})
+    parametros = CULTURAS[cultura]
+    data_in = {'dia': data.day, 'mes': data.month, 'ano': data.year}
+    return Balanco_Hidrico.simula_balanco(theta_fc, theta_wp, p, P, eto, parametros['periodo'], parametros['z_etapas'],
+                                          parametros['forma_z'], parametros['kc_etapas'], parametros['forma_kc'], data_in,
+                                          formato='dataframe')
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=16)
+def serie_eto(nome, versao):
+    """
+    Série de ETo de uma estação, calculada uma vez por versão dos dados (não alterar o retorno).
+    :parâmetro nome: nome da estação em ESTACOES.
+    :parâmetro versao: chave de versão, ver versao_estacao().
+    :return: dataframe com DATA e ETO.
+    """
+    df = carrega_estacao(nome, versao)
+    estacao = ESTACOES[nome]
+    eto = gse.gera_serie(df['TEMPERATURA_MINIMA'], df['TEMPERATURA_MAXIMA'], df['UMIDADE_RELATIVA'], df['VELOCIDADE_VENTO'], df['J'],
+                         estacao['LATITUDE'], estacao['ALTITUDE'], GSC, SIGMA, G, df['TEMPERATURA_MEDIA'])
+    return pd.DataFrame({'DATA': df['DATA'], 'ETO': eto})
 
 
 def eto_calc(dataset, metodo):
@@ -153,9 +262,48 @@ def create_download_link(df, filename):
     st.markdown(html, unsafe_allow_html=True)
 
 
+def imput_balanco(estacao, cultura):
+    """
+    Página do balanço hídrico: simula a cultura na estação escolhida e recalcula a cada mudança dos controles.
+    :parâmetro estacao: nome da estação em ESTACOES.
+    :parâmetro cultura: nome da cultura em CULTURAS.
+    """
+    versao = versao_estacao(estacao)
+    datas = carrega_estacao(estacao, versao)['DATA']
+    dias = sum(CULTURAS[cultura]['periodo'].values())
+    primeira, ultima = pd.Timestamp(datas.iloc[0]).date(), (pd.Timestamp(datas.iloc[-1]) - pd.Timedelta(days=dias - 1)).date()
+    theta_fc = st.sidebar.slider('Capacidade de campo [m^3 m^3]', min_value=0.05, max_value=0.60, value=0.23, step=0.01)
+    theta_wp = st.sidebar.slider('Ponto de murcha [m^3 m^3]', min_value=0.01, max_value=0.50, value=0.10, step=0.01)
+    p = st.sidebar.slider('Fator de disponibilidade hídrica [0 - 1]', min_value=0.0, max_value=1.0, value=0.5, step=0.05)
+    data = st.sidebar.slider('Data de plantio', min_value=primeira, max_value=ultima, value=primeira, format='DD/MM/YYYY')
+    if theta_wp >= theta_fc:
+        st.error('O ponto de murcha deve ser menor que a capacidade de campo.')
+        return
+    resultado = simula_balanco_estacao(estacao, versao, cultura, theta_fc, theta_wp, p, data)
+    st.write(
+    """
+    ### Balanço hídrico de {} em {}, plantio em {}.
+    """.format(cultura, estacao, data.strftime('%d/%m/%Y')))
+    resumo = pd.DataFrame({'ETo [mm]': resultado['ETO'].sum(), 'Precipitação [mm]': resultado['PRECIPITACAO'].sum(),
+                           'Irrigação [mm]': resultado['I'].sum(), 'Irrigações': int((resultado['I'] > 0).sum()),
+                           'Percolação [mm]': resultado['DP'].sum(), 'ETc ajustada [mm]': resultado['ETCA'].sum(),
+                           'Ks mínimo': resultado['KS'].min()}, index=[0])
+    st.write(resumo)
+    st.subheader('Umidade do solo [mm]:')
+    showPlot(reduz_pontos(resultado[['FC', 'UA', 'F', 'PMP']]))
+    st.subheader('Precipitação, irrigação e percolação [mm]:')
+    st.bar_chart(reduz_pontos(resultado[['PRECIPITACAO', 'I', 'DP']], soma=True))
+    st.subheader('ETo, ETc ajustada e Kc:')
+    showPlot(reduz_pontos(resultado[['ETO', 'ETCA', 'KC']]))
+    if st.button('Salvar balanço'):
+        create_download_link(resultado, "BALANCO_HIDRICO.csv")
+    return resultado
+
 def imput():
     st.sidebar.image('https://github.com/Hidrovales/Balanco_Hidrico/blob/main/Figuras/logo_color_app.png?raw=true')
     st.sidebar.header('Escolha a opção desejada:')
+    if st.sidebar.button('Recarregar dados'):
+        st.session_state['versao_dados'] = st.session_state.get('versao_dados', 0) + 1
            
     option_1 = st.sidebar.selectbox('Escolha o que deseja fazer:', ['<Selecione>','Ler sobre ETo', 'Gerar valor único', 'Gerar série temporal de ETo', 'Gerar balanço hídrico'])
     if option_1 == '<Selecione>':
@@ -191,14 +339,14 @@ def imput():
         if option_2 == 'PM FAO':
             eto = imput_FAO()
     if option_1 == 'Gerar série temporal de ETo':
-        option_2 = st.sidebar.selectbox('Escolha a estação:', ['<Selecione>','Rio Pardo de Minas'])
+        option_2 = st.sidebar.selectbox('Escolha a estação:', ['<Selecione>'] + list(ESTACOES))
         if option_2 == 'Rio Pardo de Minas':
             st.write(
             """
             ### Dados climáticos da estação de Rio Pardo de Minas no estado de Minas Gerais.
             """)
-            df = pd.read_csv('https://raw.githubusercontent.com/Hidrovales/Balanco_Hidrico/main/Datasets/RIO_PARDO_MINAS_AJUSTADO.csv', delimiter = ',')
-            df = df.drop(["Unnamed: 0" ],axis=1)
+            versao = versao_estacao(option_2)
+            df = carrega_estacao(option_2, versao)
             showCsv(df)
 
             if st.button('Salvar'):
@@ -211,20 +359,11 @@ def imput():
             """)
             df_drop = df.drop(["DATA","PRECIPITACAO_TOTAL","PRESSAO_ATMOSFERICA", "TEMPERATURA_PONTO_ORVALHO", "UMIDADE_RELATIVA.1", "VENTO", "J"],axis=1)
             showPlot(df_drop)
-            latitude = math.pi/180 * -15.72305554 #Converte a latitude de graus para radianos
-            altitude=850.06
-            #: Solar constant [ MJ m-2 min-1]
-            GSC = 0.0820
-            # Stefan Boltzmann constant [MJ K-4 m-2 dia-1]
-            sigma = 0.000000004903
-            G = 0
-            eto = gse.gera_serie(df['TEMPERATURA_MINIMA'], df['TEMPERATURA_MAXIMA'], df['UMIDADE_RELATIVA'], df['VELOCIDADE_VENTO'], df['J'], 
-                                 latitude, altitude, GSC, sigma, G, df['TEMPERATURA_MEDIA'])
+            eto = serie_eto(option_2, versao)
             st.subheader('Série temporal de ETo estimada:')
-            showPlot(eto)
-            df = pd.DataFrame(eto)
+            showPlot(reduz_pontos(eto.set_index('DATA')))
             if st.button('Salvar Eto'):
-                create_download_link(df, "RIO_PARDO_MINAS.csv")
+                create_download_link(eto, "RIO_PARDO_MINAS.csv")
             st.success('ETo foi calculada com sucesso!')
         elif option_2 == 'HG':
             eto = imput_HG()
@@ -233,21 +372,10 @@ def imput():
 
 
     if option_1 == 'Gerar balanço hídrico':
-        option_2 = st.sidebar.selectbox('Escolha a estação:', ['<Selecione>','Rio Pardo de Minas'])
-        if option_2 == 'Rio Pardo de Minas':
-            st.sidebar.selectbox('Escolha a cultura:', ['<Selecione>','Milho'])
-
-            theta_fc = st.sidebar.text_input(label='Capacidade de campo [m^3 m^3]', value= 0.23)
-            theta_wp = st.sidebar.text_input(label='Ponto de murcha [m^3 m^3]', value= 0.1)
-            p = st.sidebar.text_input(label='Fator de disponibilidade hídrica [0 - 1]', value= 0.5)
-            data = st.sidebar.date_input ('Dia do ano', date.today())
-            dados = {
-                'Data': data,
-                'theta_fc': float(theta_fc),
-                'theta_wp': float(theta_wp),
-                'p': float(p),
-            }
-            features = pd.DataFrame(dados, index = [0])
-
+        option_2 = st.sidebar.selectbox('Escolha a estação:', ['<Selecione>'] + list(ESTACOES))
+        if option_2 in ESTACOES:
+            cultura = st.sidebar.selectbox('Escolha a cultura:', ['<Selecione>'] + list(CULTURAS))
+            if cultura in CULTURAS:
+                imput_balanco(option_2, cultura)
 
 imput()
@@ -0,0 +1,231 @@
+"""
+Arquivo climático em disco para uma grade de estações (estação x dia x variável), mapeado em memória.
+Os valores ficam em um único arquivo binário (dados.bin), ordenado por dia, de modo que novos dias são acrescentados
+ao final sem reescrever o arquivo. A descrição (meta.json) guarda as variáveis, a data inicial, o número de dias e o
+índice de estações (NOME, LATITUDE, LONGITUDE e ALTITUDE, no formato dos dicionários dataset_point dos experimentos).
+Janelas de uma estação são lidas diretamente do mapa de memória, sem carregar a grade inteira.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import Calcula_ETo
+
+#Variáveis diárias da base NASA POWER + CHIRPS, na ordem gravada no arquivo
+VARIAVEIS = ['P', 'RH2M', 'T2M', 'T2M_MAX', 'T2M_MIN', 'WS2M', 'ALLSKY_SFC_SW_DWN']
+
+_ARQUIVO_DADOS = 'dados.bin'
+_ARQUIVO_META = 'meta.json'
+
+def _grava_meta(pasta, meta):
+  """
+  Grava a descrição do arquivo climático, trocando o arquivo de uma vez.
+  :parâmetro pasta: pasta do arquivo climático.
+  :parâmetro meta: dicionário da descrição.
+  """
+  temporario = os.path.join(pasta, _ARQUIVO_META + '.tmp')
+  with open(temporario, 'w') as arquivo:
+    json.dump(meta, arquivo, ensure_ascii=False, indent=1)
+  os.replace(temporario, os.path.join(pasta, _ARQUIVO_META))
+
+def cria_arquivo(pasta, estacoes, data_inicial, variaveis=VARIAVEIS, dtype='float64', sobrescreve=False):
+  """
+  Cria um arquivo climático vazio (sem dias).
+  :parâmetro pasta: pasta onde o arquivo será criado.
+  :parâmetro estacoes: lista de dicionários (ou dataframe) com LATITUDE, LONGITUDE, ALTITUDE e, opcionalmente, NOME.
+  :parâmetro data_inicial: data do primeiro dia ('YYYY-MM-DD').
+  :parâmetro variaveis: lista com o nome das variáveis.
+  :parâmetro dtype: tipo dos valores gravados.
+  :parâmetro sobrescreve: se True, apaga um arquivo climático já existente na pasta; se False, ele é mantido e um
+                          erro é gerado.
+  :return: ArquivoClimatico aberto para acréscimo.
+  """
+  if isinstance(estacoes, pd.DataFrame):
+    estacoes = estacoes.to_dict('records')
+  indice = []
+  for i, estacao in enumerate(estacoes):
+    indice.append({'NOME': str(estacao.get('NOME', i)), 'LATITUDE': float(estacao['LATITUDE']),
+                   'LONGITUDE': float(estacao['LONGITUDE']), 'ALTITUDE': float(estacao['ALTITUDE'])})
+  if len({e['NOME'] for e in indice}) != len(indice):
+    raise ValueError('Nomes de estações repetidos')
+  existentes = [nome for nome in (_ARQUIVO_META, _ARQUIVO_DADOS) if os.path.exists(os.path.join(pasta, nome))]
+  if existentes and not sobrescreve:
+    raise ValueError('Arquivo climático já existe em %s (%s); use sobrescreve=True para apagá-lo'
+                     % (pasta, ', '.join(existentes)))
+  os.makedirs(pasta, exist_ok=True)
+  open(os.path.join(pasta, _ARQUIVO_DADOS), 'wb' if sobrescreve else 'xb').close()
+  _grava_meta(pasta, {'data_inicial': str(pd.Timestamp(data_inicial).date()), 'dias': 0, 'dtype': np.dtype(dtype).str,
+                      'variaveis': list(variaveis), 'estacoes': indice})
+  return ArquivoClimatico(pasta, modo='r+')
+
+class ArquivoClimatico:
+  """
+  Acesso a um arquivo climático criado por cria_arquivo().
+  :parâmetro pasta: pasta do arquivo climático.
+  :parâmetro modo: 'r' para leitura ou 'r+' para leitura e acréscimo de dias.
+  """
+
+  def __init__(self, pasta, modo='r'):
+    self.pasta = pasta
+    self.modo = modo
+    with open(os.path.join(pasta, _ARQUIVO_META), 'r') as arquivo:
+      self.meta = json.load(arquivo)
+    self.variaveis = self.meta['variaveis']
+    self.estacoes = pd.DataFrame(self.meta['estacoes']).set_index('NOME')
+    self._posicao = {nome: i for i, nome in enumerate(self.estacoes.index)}
+    self._coluna = {nome: i for i, nome in enumerate(self.variaveis)}
+    self._mapeia()
+
+  def _mapeia(self):
+    """
+    Mapeia o arquivo de dados em memória com o número de dias atual.
+    """
+    dias = self.meta['dias']
+    forma = (dias, len(self._posicao), len(self.variaveis))
+    if dias:
+      self.dados = np.memmap(os.path.join(self.pasta, _ARQUIVO_DADOS), dtype=self.meta['dtype'], mode='r', shape=forma)
+    else:
+      self.dados = np.empty(forma, dtype=self.meta['dtype'])
+    self.datas = pd.date_range(self.meta['data_inicial'], periods=dias, freq='D')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *excecao):
+    self.fecha()
+
+  def fecha(self):
+    """
+    Libera o mapa de memória.
+    """
+    self.dados = None
+
+  def posicao(self, estacao):
+    """
+    Posição de uma estação no arquivo.
+    :parâmetro estacao: nome da estação ou posição.
+    :return: posição da estação.
+    """
+    if isinstance(estacao, (int, np.integer)):
+      return int(estacao)
+    return self._posicao[str(estacao)]
+
+  def estacao_proxima(self, latitude, longitude):
+    """
+    Estação mais próxima de um ponto (distância em graus).
+    :parâmetro latitude: latitude do ponto.
+    :parâmetro longitude: longitude do ponto.
+    :return: nome da estação.
+    """
+    distancia = (self.estacoes['LATITUDE'] - latitude)**2 + (self.estacoes['LONGITUDE'] - longitude)**2
+    return distancia.idxmin()
+
+  def _dias(self, data_inicial, data_final):
+    """
+    Intervalo de dias [início, fim) correspondente às datas.
+    :parâmetro data_inicial: primeira data (inclusive). Se None, desde o primeiro dia.
+    :parâmetro data_final: última data (inclusive). Se None, até o último dia.
+    :return: fatia dos dias.
+    """
+    inicio = 0 if data_inicial is None else self.datas.searchsorted(pd.Timestamp(data_inicial))
+    fim = len(self.datas) if data_final is None else self.datas.searchsorted(pd.Timestamp(data_final), side='right')
+    return slice(inicio, fim)
+
+  def valores(self, estacao, data_inicial=None, data_final=None, variaveis=None):
+    """
+    Valores de uma estação em uma janela de datas, lidos do mapa de memória (sem cópia se variaveis for None).
+    :parâmetro estacao: nome da estação ou posição.
+    :parâmetro data_inicial: primeira data (inclusive).
+    :parâmetro data_final: última data (inclusive).
+    :parâmetro variaveis: lista com o nome das variáveis. Se None, todas.
+    :return: matriz dias x variáveis.
+    """
+    janela = self.dados[self._dias(data_inicial, data_final), self.posicao(estacao)]
+    if variaveis is None:
+      return janela
+    return janela[:, [self._coluna[v] for v in variaveis]]
+
+  def janela(self, estacao, data_inicial=None, data_final=None, variaveis=None):
+    """
+    Dataframe de uma estação em uma janela de datas.
+    :parâmetro estacao: nome da estação ou posição.
+    :parâmetro data_inicial: primeira data (inclusive).
+    :parâmetro data_final: última data (inclusive).
+    :parâmetro variaveis: lista com o nome das variáveis. Se None, todas.
+    :return: dataframe com DATA e as variáveis.
+    """
+    variaveis = self.variaveis if variaveis is None else variaveis
+    dias = self._dias(data_inicial, data_final)
+    janela = pd.DataFrame(np.array(self.valores(estacao, data_inicial, data_final, variaveis)), columns=variaveis)
+    janela.insert(0, 'DATA', self.datas[dias])
+    return janela
+
+  def serie(self, estacao, variavel, data_inicial=None, data_final=None):
+    """
+    Série de uma variável no formato de entrada de balanco() (Coluna 0 - Data, Coluna 1 - Valor).
+    :parâmetro estacao: nome da estação ou posição.
+    :parâmetro variavel: nome da variável.
+    :parâmetro data_inicial: primeira data (inclusive).
+    :parâmetro data_final: última data (inclusive).
+    :return: dataframe com DATA e a variável.
+    """
+    return self.janela(estacao, data_inicial, data_final, [variavel])
+
+  def eto(self, estacao, Gsc, Sigma, G, data_inicial=None, data_final=None):
+    """
+    Série de ETo de uma estação calculada por gera_serie() sobre uma janela do arquivo.
+    :parâmetro estacao: nome da estação ou posição.
+    :parâmetro Gsc: Constante Solar em MJ K-4 m-2 dia-1
+    :parâmetro Sigma: Constante Stefan Boltzmann em MJ K-4 m-2 dia-1
+    :parâmetro G: Fluxo de calor do solo para o período de 1 dia ou 10 dias
+    :parâmetro data_inicial: primeira data (inclusive).
+    :parâmetro data_final: última data (inclusive).
+    :return: dataframe com DATA e ETO, no formato de entrada de balanco().
+    """
+    ponto = self.estacoes.iloc[self.posicao(estacao)]
+    dados = self.janela(estacao, data_inicial, data_final, ['T2M_MIN', 'T2M_MAX', 'RH2M', 'WS2M', 'T2M', 'ALLSKY_SFC_SW_DWN'])
+    J = dados['DATA'].dt.dayofyear.to_numpy()
+    eto = Calcula_ETo.gera_serie(dados['T2M_MIN'], dados['T2M_MAX'], dados['RH2M'], dados['WS2M'], J, ponto['LATITUDE'],
+                                 ponto['ALTITUDE'], Gsc, Sigma, G, dados['T2M'], None, dados['ALLSKY_SFC_SW_DWN'])
+    return pd.DataFrame({'DATA': dados['DATA'], 'ETO': eto})
+
+  def acrescenta(self, novos):
+    """
+    Acrescenta dias ao final do arquivo.
+    :parâmetro novos: matriz dias x estações x variáveis, ou dicionário estação -> dataframe com DATA e as variáveis.
+                      Os dataframes devem começar no dia seguinte ao último dia gravado e ter o mesmo número de linhas;
+                      variáveis ausentes são gravadas como NaN.
+    :return: número de dias no arquivo.
+    """
+    if self.modo != 'r+':
+      raise ValueError('Arquivo aberto apenas para leitura')
+    if isinstance(novos, dict):
+      proximo = pd.Timestamp(self.meta['data_inicial']) + pd.Timedelta(days=self.meta['dias'])
+      dias = {len(dados) for dados in novos.values()}
+      if len(dias) != 1:
+        raise ValueError('Estações com número de dias diferente')
+      matriz = np.full((dias.pop(), len(self._posicao), len(self.variaveis)), np.nan)
+      for estacao, dados in novos.items():
+        if 'DATA' in dados and len(dados) and pd.Timestamp(dados['DATA'].iloc[0]) != proximo:
+          raise ValueError('Os novos dias devem começar em ' + str(proximo.date()))
+        colunas = [v for v in self.variaveis if v in dados]
+        matriz[:, self.posicao(estacao), [self._coluna[v] for v in colunas]] = dados[colunas].to_numpy(dtype=float)
+      novos = matriz
+    novos = np.ascontiguousarray(novos, dtype=self.meta['dtype'])
+    if novos.shape[1:] != (len(self._posicao), len(self.variaveis)):
+      raise ValueError('Forma esperada: (dias, %d, %d)' % (len(self._posicao), len(self.variaveis)))
+    #meta.json é a referência: bytes além dos dias registrados (gravação interrompida antes de atualizar meta.json)
+    #são descartados, para que os novos dias fiquem alinhados
+    caminho = os.path.join(self.pasta, _ARQUIVO_DADOS)
+    tamanho = self.meta['dias'] * len(self._posicao) * len(self.variaveis) * novos.itemsize
+    if os.path.getsize(caminho) < tamanho:
+      raise ValueError('Arquivo de dados menor que o registrado em ' + _ARQUIVO_META)
+    self.dados = None
+    with open(caminho, 'ab') as arquivo:
+      arquivo.truncate(tamanho)
+      arquivo.write(novos.tobytes())
+    self.meta['dias'] += novos.shape[0]
+    _grava_meta(self.pasta, self.meta)
+    self._mapeia()
+    return self.meta['dias']
@@ -5,10 +5,69 @@ Referência: FAO 56 (2006)
 
 import numpy as np
 import datetime
+import functools
+import itertools
 import sqlite3
 import contextlib
 import pandas as pd
-import matplotlib.pyplot as plt
+import Instrumentacao
+
+#Colunas da tabela results, na ordem de gravação
+COLUNAS_RESULTADOS = ['LOCAL', 'CULTURA', 'DATA_PLANTIO', 'KC_INICIAL', 'KC_MEDIO', 'KC_FINAL', 'ZR_INICIAL', 'ZR_MEDIO', 'ZR_FINAL',
+                      'PERIODO_INICIAL', 'PERIODO_DESENVOLVIMENTO', 'PERIODO_MEDIO', 'PERIODO_FINAL', 'P', 'THETA_FC', 'THETA_WP',
+                      'ETO', 'PRECIPITACAO', 'KC', 'ZR', 'ADT', 'AFA', 'DIN', 'DFIM', 'KS', 'I', 'DP', 'ETCA', 'FC', 'PMP', 'F', 'UA']
+
+#Colunas da tabela results com séries diárias (BLOB)
+COLUNAS_SERIES = COLUNAS_RESULTADOS[16:]
+
+#Tipo do array estruturado retornado por simula_balanco(): data e séries diárias, um registro por dia
+DTYPE_SIMULACAO = np.dtype([('DATA', 'datetime64[D]')] + [(coluna, float) for coluna in COLUNAS_SERIES])
+
+#Cada cenário é identificado pela chave ID (INTEGER PRIMARY KEY), que não muda com VACUUM
+_SQL_CRIA_RESULTS = """CREATE TABLE IF NOT EXISTS results(ID INTEGER PRIMARY KEY, LOCAL TEXT, CULTURA TEXT, DATA_PLANTIO TEXT,
+                                              KC_INICIAL INT, KC_MEDIO INT, KC_FINAL INT,
+                                              ZR_INICIAL INT, ZR_MEDIO INT, ZR_FINAL INT,
+                                              PERIODO_INICIAL INT, PERIODO_DESENVOLVIMENTO INT, PERIODO_MEDIO INT, PERIODO_FINAL INT,
+                                              P FLOAT, THETA_FC FLOAT, THETA_WP FLOAT,
+                                              ETO BLOB, PRECIPITACAO BLOB,
+                                              KC BLOB, ZR BLOB, ADT BLOB, AFA BLOB, DIN BLOB, DFIM BLOB, KS BLOB,
+                                              I BLOB, DP BLOB, ETCA BLOB, FC BLOB, PMP BLOB, F BLOB, UA BLOB
+                                              )"""
+
+_SQL_INSERE_RESULTS = 'INSERT INTO results({}) VALUES({})'.format(', '.join(COLUNAS_RESULTADOS),
+                                                                   ', '.join('?' * len(COLUNAS_RESULTADOS)))
+
+#Inserção com o ID informado (gravação em lote, ver GravadorResultados.descarrega())
+_SQL_INSERE_RESULTS_ID = 'INSERT INTO results(ID, {}) VALUES({})'.format(', '.join(COLUNAS_RESULTADOS),
+                                                                         ', '.join('?' * (len(COLUNAS_RESULTADOS) + 1)))
+
+#Índice usado pelas consultas por local, cultura e data de plantio
+_SQL_CRIA_INDICE_RESULTS = """CREATE INDEX IF NOT EXISTS results_local_cultura_data ON results(LOCAL, CULTURA, DATA_PLANTIO)"""
+
+#Formato das séries diárias gravadas como BLOB: tipo numpy e forma (DIAS = soma dos PERIODO_*)
+_SQL_CRIA_FORMATO = """CREATE TABLE IF NOT EXISTS results_formato(COLUNA TEXT PRIMARY KEY, DTYPE TEXT, FORMA TEXT)"""
+
+_SQL_INSERE_FORMATO = """INSERT OR IGNORE INTO results_formato VALUES(?, ?, ?)"""
+
+#Resumo de cada cenário (totais da estação e Ks mínimo), com o mesmo ID da tabela results
+_SQL_CRIA_RESUMO = """CREATE TABLE IF NOT EXISTS results_resumo(ID INTEGER PRIMARY KEY, LOCAL TEXT, CULTURA TEXT, DATA_PLANTIO TEXT,
+                                                             DIAS INT, ETO_TOTAL FLOAT, PRECIPITACAO_TOTAL FLOAT,
+                                                             I_TOTAL FLOAT, DP_TOTAL FLOAT, ETCA_TOTAL FLOAT, KS_MIN FLOAT,
+                                                             IRRIGACOES INT
+                                                             )"""
+
+_SQL_CRIA_INDICE_RESUMO = """CREATE INDEX IF NOT EXISTS results_resumo_local_cultura_data ON results_resumo(LOCAL, CULTURA, DATA_PLANTIO)"""
+
+#Colunas da tabela results_resumo
+COLUNAS_RESUMO = ['ID', 'LOCAL', 'CULTURA', 'DATA_PLANTIO', 'DIAS', 'ETO_TOTAL', 'PRECIPITACAO_TOTAL',
+                  'I_TOTAL', 'DP_TOTAL', 'ETCA_TOTAL', 'KS_MIN', 'IRRIGACOES']
+
+_SQL_INSERE_RESUMO = 'INSERT INTO results_resumo({}) VALUES({})'.format(', '.join(COLUNAS_RESUMO), ', '.join('?' * len(COLUNAS_RESUMO)))
+
+#Fases do cultivo, na ordem, com as etapas no início e no fim de cada fase (Equação 66, FAO 56)
+FASES = ('inicial', 'desenvolvimento', 'media', 'final')
+_EXTREMOS_FASES = {'inicial': ('inicial', 'inicial'), 'desenvolvimento': ('inicial', 'media'),
+                   'media': ('media', 'media'), 'final': ('media', 'final')}
 
 def interpolacao(data, tempo, etapas, forma, data_in):
   """
@@ -20,28 +79,47 @@ def interpolacao(data, tempo, etapas, forma, data_in):
   :parâmetro data_in: data de início do cultivo.
   :return: valor interpolado
   """
-  def interpola(prox, prev, L_etapa, Sum_L_prev, i):
-    i = i + 1
-    a = (i - Sum_L_prev) / L_etapa
-    b = prox - prev
-    c = a * b + prev
-    return c
-  i = data - data_in
-  if i.days < tempo['inicial']:
-    if forma['inicial']:
-      valor = etapas['inicial']
-  elif i.days < tempo['inicial'] + tempo['desenvolvimento']:
-    if not forma['desenvolvimento']:
-      valor = interpola(etapas['media'], etapas['inicial'], tempo['desenvolvimento'], tempo['inicial'], i.days)
-  elif i.days < tempo['inicial'] + tempo['desenvolvimento'] + tempo['media']:
-    if forma['media']:
-      valor = etapas['media']
-  elif i.days < tempo['inicial'] + tempo['desenvolvimento'] + tempo['media'] + tempo['final']:
-    if not forma['final']:
-      Sum_L_prev = tempo['inicial'] + tempo['desenvolvimento'] + tempo['media']
-      valor = interpola(etapas['final'], etapas['media'], tempo['final'], Sum_L_prev, i.days)
+  i = (data - data_in).days
+  valores = curva_etapas(tempo, etapas, forma)
+  if not 0 <= i < valores.shape[0]:
+    raise ValueError('Data fora do ciclo do cultivo: {}'.format(data))
+  return float(valores[i])
+
+def curva_etapas(tempo, etapas, forma):
+  """
+  Curva diária (Kc ou Zr) de todo o ciclo do cultivo: Equação 66 (FAO 56).
+  Cada fase vai da etapa do seu início à etapa do seu fim (inicial: inicial -> inicial, desenvolvimento: inicial -> media,
+  media: media -> media, final: media -> final); fase constante fica com a etapa do fim e fase não constante é interpolada.
+  A curva é calculada uma vez por combinação de parâmetros e compartilhada entre as chamadas (array somente leitura).
+  :parâmetro tempo: dicionário com o número de dias de cada fase (inicial, desenvolvimento, media e final).
+  :parâmetro etapas: dicionário com as etapas inicial, media e final.
+  :parâmetro forma: dicionário com a forma de cada etapa (inicial, desenvolvimento, media e final). Para constante, etapa recebe True.
+  :return: array somente leitura com o valor de cada dia do cultivo.
+  """
+  return _curva_etapas(tuple(int(tempo[fase]) for fase in FASES),
+                       tuple(float(etapas[etapa]) for etapa in ('inicial', 'media', 'final')),
+                       tuple(bool(forma[fase]) for fase in FASES))
+
+@functools.lru_cache(maxsize=256)
+def _curva_etapas(tempo, etapas, forma):
+  """
+  Curva diária de curva_etapas(), guardada por parâmetros.
+  :parâmetro tempo: tupla com o número de dias de cada fase, na ordem de FASES.
+  :parâmetro etapas: tupla com as etapas inicial, media e final.
+  :parâmetro forma: tupla com a forma de cada fase, na ordem de FASES.
+  :return: array somente leitura com o valor de cada dia do cultivo.
+  """
+  Instrumentacao.conta('Balanco_Hidrico.curva_etapas.falhas')
+  etapas = dict(zip(('inicial', 'media', 'final'), etapas))
+  trechos = []
+  for L_etapa, fase, constante in zip(tempo, FASES, forma):
+    prev, prox = (etapas[etapa] for etapa in _EXTREMOS_FASES[fase])
+    if constante:
+      trechos.append(np.full(L_etapa, prox))
     else:
-      valor = etapas['final']
+      trechos.append((np.arange(1, L_etapa + 1) / L_etapa) * (prox - prev) + prev)
+  valor = np.concatenate(trechos)
+  valor.setflags(write=False)
   return valor
 
 def AFA(p, ADT):
@@ -153,6 +231,113 @@ def Irrigacao(Din, AFA, ET):
   else:
     return 0
 
+def _balanco_diario(eto, P, kc, Zr, theta_fc, theta_wp, p):
+  """
+  Passo diário do balanço hídrico (Equações 81 a 88 da FAO 56) para toda a estação de cultivo.
+  As variáveis que dependem apenas do dia (ADT, AFA, FC, PMP e F) são calculadas como vetores; a
+  recorrência do déficit (Din e Dfim) roda em um único laço sobre floats, com as mesmas operações das
+  funções Din(), Ks(), Etca(), Irrigacao(), DP() e Dfim(), e Ks, ETca, I e DP são obtidos depois em vetores.
+  :parâmetro eto: array com a Evapotranspiração de referencia de cada dia [mm].
+  :parâmetro P: array com a precipitação de cada dia [mm].
+  :parâmetro kc: array com o coeficiente de cultura de cada dia.
+  :parâmetro Zr: array com a profundidade das raízes de cada dia [m].
+  :parâmetro theta_fc: capacidade de campo [m^3 m^3].
+  :parâmetro theta_wp: ponto de murcha [m^3 m^3].
+  :parâmetro p: fator de disponibilidade hídrica [0 - 1].
+  :return: dicionário com os arrays KC, ZR, ADT, AFA, DIN, DFIM, KS, I, DP, ETCA, FC, PMP, F e UA.
+  """
+  n = eto.shape[0]
+  kc, Zr = kc[:n], Zr[:n]
+  adt = ADT(theta_fc, theta_wp, Zr)
+  afa = AFA(p, ADT= adt)
+  FC = Zr * theta_fc * 1000
+  PMP = Zr * theta_wp * 1000
+  F = FC - (FC - PMP) * p
+  etc = eto * kc
+  #------------------------------------
+  #Recorrência do déficit: só Din e Dfim dependem do dia anterior.
+  #No dia 0 o déficit final anterior é nulo, portanto Din resulta em 0 para qualquer precipitação.
+  result_din, result_dfim = [], []
+  dfim = 0
+  for etc_j, P_j, adt_j, afa_j in zip(etc.tolist(), P.tolist(), adt.tolist(), afa.tolist()):
+    if P_j > 0:
+      din = dfim - P_j
+      if din < 0:
+        din = 0
+    else:
+      din = dfim
+    if din < afa_j:
+      etca = etc_j
+      I = 0
+    else:
+      etca = etc_j * ((adt_j - din) / (adt_j - afa_j))
+      I = din + etca if din >= afa_j else 0
+    dp = P_j + I - etca - dfim
+    if not dp > 0:
+      dp = 0
+    dfim = dfim - P_j - I + etca + dp
+    if dfim < 0:
+      dfim = 0
+    result_din.append(din)
+    result_dfim.append(dfim)
+  #------------------------------------
+  din = np.array(result_din, dtype=float)
+  dfim = np.array(result_dfim, dtype=float)
+  resultado = {'KC': kc, 'ZR': Zr, 'ADT': adt, 'AFA': afa, 'FC': FC, 'PMP': PMP, 'F': F}
+  resultado.update(_completa_balanco(din, dfim, etc, P[:n], adt, afa, FC))
+  return resultado
+
+def _completa_balanco(din, dfim, etc, P, adt, afa, FC):
+  """
+  Recalcula Ks, ETca, I, DP e UA em vetores a partir de Din e Dfim, com as mesmas operações do laço
+  de _balanco_diario(). Aceita vetores (dia) ou matrizes (cenário x dia).
+  :return: dicionário com os arrays DIN, DFIM, KS, I, DP, ETCA e UA.
+  """
+  with np.errstate(invalid='ignore', divide='ignore'):
+    ks = np.where(din < afa, 1.0, (adt - din) / (adt - afa))
+  etca = etc * ks
+  I = np.where(din >= afa, din + etca, 0.0)
+  dfim_anterior = np.concatenate((np.zeros(dfim.shape[:-1] + (1,)), dfim[..., :-1]), axis=-1)
+  dp = P + I - etca - dfim_anterior
+  dp = np.where(dp > 0, dp, 0.0)
+  return {'DIN': din, 'DFIM': dfim, 'KS': ks, 'I': I, 'DP': dp, 'ETCA': etca, 'UA': FC - din}
+
+def _balanco_diario_lote(eto, P, kc, Zr, theta_fc, theta_wp, p):
+  """
+  Mesmo cálculo de _balanco_diario() para vários cultivos de uma vez, em matrizes (cenário x dia).
+  O laço percorre os dias e cada passo é uma operação vetorial sobre todos os cenários.
+  :parâmetro eto, P, kc, Zr: matrizes (cenário x dia).
+  :parâmetro theta_fc, theta_wp, p: vetores (cenário x 1) com os parâmetros de solo de cada cenário.
+  :return: dicionário com as matrizes KC, ZR, ADT, AFA, DIN, DFIM, KS, I, DP, ETCA, FC, PMP, F e UA.
+  """
+  adt = ADT(theta_fc, theta_wp, Zr)
+  afa = AFA(p, ADT= adt)
+  FC = Zr * theta_fc * 1000
+  PMP = Zr * theta_wp * 1000
+  F = FC - (FC - PMP) * p
+  etc = eto * kc
+  #------------------------------------
+  din = np.empty(eto.shape)
+  dfim = np.empty(eto.shape)
+  dfim_j = np.zeros(eto.shape[0])
+  with np.errstate(invalid='ignore', divide='ignore'):
+    for j in range(eto.shape[1]):
+      P_j, adt_j, afa_j = P[:, j], adt[:, j], afa[:, j]
+      din_j = np.where(P_j > 0, dfim_j - P_j, dfim_j)
+      din_j = np.where(din_j < 0, 0.0, din_j)
+      etca = np.where(din_j < afa_j, etc[:, j], etc[:, j] * ((adt_j - din_j) / (adt_j - afa_j)))
+      I = np.where(din_j >= afa_j, din_j + etca, 0.0)
+      dp = P_j + I - etca - dfim_j
+      dp = np.where(dp > 0, dp, 0.0)
+      dfim_j = dfim_j - P_j - I + etca + dp
+      dfim_j = np.where(dfim_j < 0, 0.0, dfim_j)
+      din[:, j] = din_j
+      dfim[:, j] = dfim_j
+  #------------------------------------
+  resultado = {'KC': kc, 'ZR': Zr, 'ADT': adt, 'AFA': afa, 'FC': FC, 'PMP': PMP, 'F': F}
+  resultado.update(_completa_balanco(din, dfim, etc, P, adt, afa, FC))
+  return resultado
+
 #Função para executar INSERT INTO
 def execute_insert(sql,data,database_path):
     """
@@ -181,12 +366,14 @@ def execute(sql,database_path):
                 cursor.execute(sql)
                 return cursor.fetchall()
 
+@Instrumentacao.medido()
 def plot_balanco(df, figsize):
   """
   Plotar gráfico do balanço hídrico.
   :parametro df: dataframe com todas as variáveis geradas pela função balanco.
   :parametro figsize: tamanho da figura (x,y).
   """
+  import matplotlib.pyplot as plt
   import seaborn as sns
   dias = df['PERIODO_INICIAL'] + df['PERIODO_DESENVOLVIMENTO'] + df['PERIODO_MEDIO'] + df['PERIODO_FINAL']
   data_list = [datetime.datetime.strptime(df['DATA_PLANTIO'], '%Y-%m-%d %H:%M:%S') + datetime.timedelta(days=idx) for idx in range(dias)]
@@ -230,12 +417,14 @@ def plot_balanco(df, figsize):
   pass
   return
 
+@Instrumentacao.medido()
 def plot_extras(df, figsize):
   """
   Plotar gráfico com a ETo, ETc e Kc usados no balanço hídrico.
   :parametro df: dataframe com todas as variáveis geradas pela função balanco.
   :parametro figsize: tamanho da figura (x,y).
   """
+  import matplotlib.pyplot as plt
   import seaborn as sns
   eto = np.frombuffer(df['ETO'])
   etc = np.frombuffer(df['ETCA'])
@@ -269,6 +458,7 @@ def plot_extras(df, figsize):
   pass
   return 
  
+@Instrumentacao.medido()
 def balanco(local, cultura, theta_fc, theta_wp, p, P, eto, periodo, z_etapas, forma_z, kc_etapas, forma_kc, data_in, database_path):
   """
   Balanço de irrigação
@@ -285,87 +475,511 @@ def balanco(local, cultura, theta_fc, theta_wp, p, P, eto, periodo, z_etapas, fo
   :parâmetro forma_kc: dicionário com a forma de cada etapa (inicial, desenvolvimento, media e final) do coeficiente de cultura. 
                        Para constante, etapa recebe True.
   :parâmetro data_in: data de início do cultivo.
+  :parâmetro database_path: caminho para o banco de dados ou um GravadorResultados. Se None, o resultado não é gravado
+                            e sim retornado como um dicionário com as colunas de COLUNAS_RESULTADOS.
+  """
+  data_in, series = _simula(theta_fc, theta_wp, p, P, eto, periodo, z_etapas, forma_z, kc_etapas, forma_kc, data_in)
+  linha = {'LOCAL': local, 'CULTURA': cultura, 'DATA_PLANTIO': data_in,
+           'KC_INICIAL': kc_etapas['inicial'], 'KC_MEDIO': kc_etapas['media'], 'KC_FINAL': kc_etapas['final'],
+           'ZR_INICIAL': z_etapas['inicial'], 'ZR_MEDIO': z_etapas['media'], 'ZR_FINAL': z_etapas['final'],
+           'PERIODO_INICIAL': periodo['inicial'], 'PERIODO_DESENVOLVIMENTO': periodo['desenvolvimento'],
+           'PERIODO_MEDIO': periodo['media'], 'PERIODO_FINAL': periodo['final'],
+           'P': p, 'THETA_FC': theta_fc, 'THETA_WP': theta_wp}
+  linha.update(series)
+  if database_path is None:
+    return linha
+  grava_resultado(linha, database_path)
+  return
+
+def _recorta_serie(serie, data_in, dias):
+  """
+  Recorta os dias do cultivo de uma série diária ordenada pela data, por busca binária nas datas.
+  :parâmetro serie: dataframe com a série temporal diária (Coluna 0 - Data, Coluna 1 - Valor).
+  :parâmetro data_in: data de início do cultivo (datetime).
+  :parâmetro dias: número de dias do cultivo.
+  :return: array float64 com os valores dos dias do cultivo, ou None se a série não tiver todos os dias seguidos.
+  """
+  datas = serie.iloc[:,0].to_numpy()
+  if datas.dtype.kind != 'M':
+    datas = pd.to_datetime(datas).values
+  esperadas = np.datetime64(data_in.date(), 'D') + np.arange(dias)
+  inicio = np.searchsorted(datas, esperadas[0])
+  recorte = slice(inicio, inicio + dias)
+  if datas[recorte].shape[0] < dias or not (datas[recorte] == esperadas).all():
+    return None
+  return np.array(serie.iloc[:,1].to_numpy()[recorte], dtype=float)
+
+def _simula(theta_fc, theta_wp, p, P, eto, periodo, z_etapas, forma_z, kc_etapas, forma_kc, data_in):
+  """
+  Recorta as séries do cultivo e executa o balanço hídrico diário (parâmetros como em balanco()).
+  :return: data de plantio (datetime) e dicionário com as séries diárias de COLUNAS_SERIES.
   """
   #------------------------------------
   dias = sum(periodo.values())
+  Instrumentacao.conta('Balanco_Hidrico.cultivos')
+  Instrumentacao.conta('Balanco_Hidrico.dias', dias)
   data_in = datetime.datetime(data_in['ano'], data_in['mes'], data_in['dia'])
-  data_list = [data_in + datetime.timedelta(days=idx) for idx in range(dias)]
-  #------------------------------------
-  eto = eto[eto.iloc[:,0] >= data_list[0]]
-  eto = eto[eto.iloc[:,0] <= data_list[-1]]
-  eto = eto.iloc[:,1].values
-  #------------------------------------
-  P = P[P.iloc[:,0] >= data_list[0]]
-  P = P[P.iloc[:,0] <= data_list[-1]]
-  P = P.iloc[:,1].values
   #------------------------------------
-  #Informações para o dia 0:
-  etca = 0
-  dfim = 0
-  din = 0
+  eto = _recorta_serie(eto, data_in, dias)
+  P = _recorta_serie(P, data_in, dias)
+  if eto is None or P is None:
+    raise ValueError('As séries de ETo e precipitação não cobrem os {} dias do cultivo a partir de {}'.format(dias, data_in))
+  kc = curva_etapas(periodo, kc_etapas, forma_kc)
+  Zr = curva_etapas(periodo, z_etapas, forma_z)
+  series = {'ETO': eto, 'PRECIPITACAO': P}
+  series.update(_balanco_diario(eto, P, kc, Zr, theta_fc, theta_wp, p))
+  return data_in, series
+
+@Instrumentacao.medido()
+def simula_balanco(theta_fc, theta_wp, p, P, eto, periodo, z_etapas, forma_z, kc_etapas, forma_kc, data_in, formato='array'):
+  """
+  Balanço hídrico de um cultivo calculado apenas em memória, sem gravar no banco de dados.
+  Os parâmetros são os de balanco(). Para gravar o resultado, ver grava_simulacao().
+  :parâmetro formato: 'array' para um array estruturado contíguo com o tipo DTYPE_SIMULACAO (um registro por dia)
+                      ou 'dataframe' para um dataframe indexado pela data.
+  :return: DATA e as séries diárias de COLUNAS_SERIES (ETO, PRECIPITACAO, KC, ZR, ADT, AFA, DIN, DFIM, KS, I, DP, ETCA,
+           FC, PMP, F e UA).
+  """
+  if formato not in ('array', 'dataframe'):
+    raise ValueError("formato deve ser 'array' ou 'dataframe'")
+  data_in, series = _simula(theta_fc, theta_wp, p, P, eto, periodo, z_etapas, forma_z, kc_etapas, forma_kc, data_in)
+  dias = series['KC'].shape[0]
+  simulacao = np.empty(dias, dtype=DTYPE_SIMULACAO)
+  simulacao['DATA'] = np.datetime64(data_in.date(), 'D') + np.arange(dias)
+  for coluna in COLUNAS_SERIES:
+    simulacao[coluna] = series[coluna]
+  if formato == 'dataframe':
+    return pd.DataFrame(simulacao).set_index('DATA')
+  return simulacao
+
+def linha_simulacao(simulacao, local, cultura, theta_fc, theta_wp, p, periodo, z_etapas, kc_etapas):
+  """
+  Converte o resultado de simula_balanco() em uma linha da tabela results (formato de balanco() com database_path=None).
+  :parâmetro simulacao: array estruturado ou dataframe retornado por simula_balanco().
+  :parâmetro local, cultura, theta_fc, theta_wp, p, periodo, z_etapas, kc_etapas: parâmetros do cultivo, como em balanco().
+  :return: dicionário com as colunas de COLUNAS_RESULTADOS.
+  """
+  if isinstance(simulacao, pd.DataFrame):
+    data_in, series = simulacao.index[0], {coluna: simulacao[coluna].to_numpy(dtype=float) for coluna in COLUNAS_SERIES}
+  else:
+    data_in, series = simulacao['DATA'][0], {coluna: np.ascontiguousarray(simulacao[coluna]) for coluna in COLUNAS_SERIES}
+  linha = {'LOCAL': local, 'CULTURA': cultura, 'DATA_PLANTIO': pd.Timestamp(data_in).to_pydatetime(),
+           'KC_INICIAL': kc_etapas['inicial'], 'KC_MEDIO': kc_etapas['media'], 'KC_FINAL': kc_etapas['final'],
+           'ZR_INICIAL': z_etapas['inicial'], 'ZR_MEDIO': z_etapas['media'], 'ZR_FINAL': z_etapas['final'],
+           'PERIODO_INICIAL': periodo['inicial'], 'PERIODO_DESENVOLVIMENTO': periodo['desenvolvimento'],
+           'PERIODO_MEDIO': periodo['media'], 'PERIODO_FINAL': periodo['final'],
+           'P': p, 'THETA_FC': theta_fc, 'THETA_WP': theta_wp}
+  linha.update(series)
+  return linha
+
+def grava_simulacao(simulacao, local, cultura, theta_fc, theta_wp, p, periodo, z_etapas, kc_etapas, database_path):
+  """
+  Grava o resultado de simula_balanco() nas tabelas results e results_resumo.
+  :parâmetro simulacao: array estruturado ou dataframe retornado por simula_balanco().
+  :parâmetro local, cultura, theta_fc, theta_wp, p, periodo, z_etapas, kc_etapas: parâmetros do cultivo, como em balanco().
+  :parâmetro database_path: caminho para o banco de dados ou um GravadorResultados.
+  """
+  grava_resultado(linha_simulacao(simulacao, local, cultura, theta_fc, theta_wp, p, periodo, z_etapas, kc_etapas), database_path)
+
+@Instrumentacao.medido()
+def grava_resultado(linha, database_path):
+  """
+  Grava o resultado de um balanço hídrico na tabela results e o seu resumo em results_resumo, na mesma transação.
+  :parâmetro linha: dicionário com as colunas de COLUNAS_RESULTADOS, como retornado por balanco() com database_path=None.
+                    As séries diárias (arrays) são gravadas como BLOB.
+  :parâmetro database_path: caminho para o banco de dados ou um GravadorResultados, que acumula a linha para gravação em lote.
+  """
+  if isinstance(database_path, GravadorResultados):
+    database_path.adiciona(linha)
+    return
+  with contextlib.closing(sqlite3.connect(database_path)) as conn: # auto-closes
+    with conn: # auto-commits
+      _cria_tabelas(conn)
+      id_cenario = conn.execute(_SQL_INSERE_RESULTS, _valores_linha(linha)).lastrowid
+      conn.execute(_SQL_INSERE_RESUMO, (id_cenario,) + _valores_resumo(linha))
+    Instrumentacao.conta('Balanco_Hidrico.sql.instrucoes', 2)
+    Instrumentacao.conta('Balanco_Hidrico.sql.linhas_gravadas')
+
+def _valores_resumo(linha):
+  """
+  Calcula o resumo de um resultado de balanco() para a tabela results_resumo.
+  :parâmetro linha: dicionário com as colunas de COLUNAS_RESULTADOS.
+  :return: tupla na ordem de COLUNAS_RESUMO, sem o ID.
+  """
+  return (linha['LOCAL'], linha['CULTURA'], linha['DATA_PLANTIO'], int(np.size(linha['I'])),
+          float(np.sum(linha['ETO'])), float(np.sum(linha['PRECIPITACAO'])),
+          float(np.sum(linha['I'])), float(np.sum(linha['DP'])), float(np.sum(linha['ETCA'])),
+          float(np.min(linha['KS'])), int(np.count_nonzero(np.asarray(linha['I']) > 0)))
+
+def _cria_tabelas(conn):
+  """
+  Cria as tabelas results, results_formato e results_resumo e seus índices, caso ainda não existam.
+  :parâmetro conn: conexão com o banco de dados.
+  """
+  _migra_results(conn)
+  conn.execute(_SQL_CRIA_RESULTS)
+  conn.execute(_SQL_CRIA_INDICE_RESULTS)
+  conn.execute(_SQL_CRIA_FORMATO)
+  conn.executemany(_SQL_INSERE_FORMATO, [(coluna, np.dtype(float).str, '(DIAS,)') for coluna in COLUNAS_SERIES])
+  conn.execute(_SQL_CRIA_RESUMO)
+  conn.execute(_SQL_CRIA_INDICE_RESUMO)
+
+def _migra_results(conn):
+  """
+  Acrescenta a chave ID à tabela results de bancos gerados por versões anteriores, que identificavam os cenários pelo
+  rowid implícito (renumerado pelo VACUUM). Cada cenário recebe como ID o rowid atual, o mesmo usado em results_resumo.
+  :parâmetro conn: conexão com o banco de dados.
+  """
+  colunas = [linha[1] for linha in conn.execute('PRAGMA table_info(results)')]
+  if not colunas or 'ID' in colunas:
+    return
+  conn.execute('DROP INDEX IF EXISTS results_local_cultura_data')
+  conn.execute('ALTER TABLE results RENAME TO results_sem_id')
+  conn.execute(_SQL_CRIA_RESULTS)
+  conn.execute('INSERT INTO results(ID, {0}) SELECT rowid, {0} FROM results_sem_id'.format(', '.join(COLUNAS_RESULTADOS)))
+  conn.execute('DROP TABLE results_sem_id')
+
+def _coluna_id(conn):
+  """
+  Coluna que identifica os cenários na tabela results: ID ou, em bancos de versões anteriores ainda não migrados
+  por prepara_banco(), o rowid.
+  :parâmetro conn: conexão com o banco de dados.
+  :return: nome da coluna.
+  """
+  colunas = [linha[1] for linha in conn.execute('PRAGMA table_info(results)')]
+  return 'ID' if 'ID' in colunas or not colunas else 'rowid'
+
+@Instrumentacao.medido()
+def prepara_banco(database_path):
+  """
+  Cria as tabelas e índices no banco de dados. Útil para bancos gerados por versões anteriores: a tabela results
+  recebe a chave ID e os cenários que ainda não têm resumo em results_resumo são resumidos a partir das séries gravadas.
+  :parâmetro database_path: caminho para o banco de dados
+  """
+  with contextlib.closing(sqlite3.connect(database_path)) as conn: # auto-closes
+    with conn: # auto-commits
+      _cria_tabelas(conn)
+      formatos = _formatos(conn)
+      colunas = ['LOCAL', 'CULTURA', 'DATA_PLANTIO', 'ETO', 'PRECIPITACAO', 'I', 'DP', 'ETCA', 'KS']
+      cursor = conn.execute('SELECT ID, {} FROM results WHERE ID NOT IN (SELECT ID FROM results_resumo)'.format(', '.join(colunas)))
+      resumos = []
+      for id_cenario, *valores in cursor.fetchall():
+        linha = dict(zip(colunas, valores))
+        for coluna in colunas[3:]:
+          linha[coluna] = np.frombuffer(linha[coluna], dtype=formatos[coluna])
+        resumos.append((id_cenario,) + _valores_resumo(linha))
+      conn.executemany(_SQL_INSERE_RESUMO, resumos)
+
+@Instrumentacao.medido()
+def consulta_resumo(database_path, local=None, cultura=None, ano_inicial=None, ano_final=None):
+  """
+  Consulta a tabela results_resumo (totais da estação por cenário), sem ler as séries diárias.
+  Análises de frequência podem também ser feitas diretamente em SQL, por exemplo:
+    SELECT LOCAL, strftime('%m-%d', DATA_PLANTIO), AVG(I_TOTAL), MAX(I_TOTAL) FROM results_resumo GROUP BY 1, 2
+  :parâmetro database_path: caminho para o banco de dados
+  :parâmetro local, cultura, ano_inicial, ano_final: filtros, como em consulta_resultados().
+  :return: dataframe com as colunas de COLUNAS_RESUMO.
+  """
+  where, parametros = _filtros_sql(local, cultura, ano_inicial, ano_final)
+  sql = 'SELECT {} FROM results_resumo{} ORDER BY ID'.format(', '.join(COLUNAS_RESUMO), where)
+  with contextlib.closing(sqlite3.connect(database_path)) as conn: # auto-closes
+    Instrumentacao.conta('Balanco_Hidrico.sql.instrucoes')
+    return pd.DataFrame(conn.execute(sql, parametros).fetchall(), columns=COLUNAS_RESUMO)
+
+@Instrumentacao.medido()
+def consulta_resultados(database_path, variaveis=None, local=None, cultura=None, ano_inicial=None, ano_final=None):
+  """
+  Consulta a tabela results com os filtros aplicados no próprio SQL, lendo apenas as variáveis pedidas.
+  Cada cenário é identificado pela coluna ID (chave da tabela results).
+  :parâmetro database_path: caminho para o banco de dados
+  :parâmetro variaveis: lista de colunas de COLUNAS_RESULTADOS a retornar. Padrão: todas.
+  :parâmetro local: nome ou lista de nomes de locais.
+  :parâmetro cultura: nome ou lista de nomes de culturas.
+  :parâmetro ano_inicial: primeiro ano de plantio (inclusive).
+  :parâmetro ano_final: último ano de plantio (inclusive).
+  :return: dataframe com ID, LOCAL, CULTURA, DATA_PLANTIO e as variáveis pedidas. Séries diárias (BLOB) são retornadas
+           como arrays numpy somente leitura.
+  """
+  variaveis = COLUNAS_RESULTADOS[3:] if variaveis is None else list(variaveis)
+  desconhecidas = set(variaveis) - set(COLUNAS_RESULTADOS)
+  if desconhecidas:
+    raise ValueError('Variáveis inexistentes na tabela results: {}'.format(sorted(desconhecidas)))
+  colunas = ['LOCAL', 'CULTURA', 'DATA_PLANTIO'] + [v for v in variaveis if v not in ('LOCAL', 'CULTURA', 'DATA_PLANTIO')]
+  where, parametros = _filtros_sql(local, cultura, ano_inicial, ano_final)
+  with contextlib.closing(sqlite3.connect(database_path)) as conn: # auto-closes
+    id_results = _coluna_id(conn)
+    sql = 'SELECT {0}, {1} FROM results{2} ORDER BY {0}'.format(id_results, ', '.join(colunas), where)
+    linhas = conn.execute(sql, parametros).fetchall()
+    formatos = _formatos(conn)
+  Instrumentacao.conta('Balanco_Hidrico.sql.instrucoes', 3)
+  Instrumentacao.conta('Balanco_Hidrico.sql.linhas_lidas', len(linhas))
+  df = pd.DataFrame(linhas, columns=['ID'] + colunas)
+  for coluna in colunas[3:]:
+    if coluna in COLUNAS_SERIES:
+      df[coluna] = [np.frombuffer(valor, dtype=formatos[coluna]) for valor in df[coluna]]
+  return df
+
+def _filtros_sql(local=None, cultura=None, ano_inicial=None, ano_final=None):
+  """
+  Monta a cláusula WHERE das consultas à tabela results.
+  :return: texto da cláusula (vazio se não houver filtros) e lista de parâmetros.
+  """
+  filtros, parametros = [], []
+  for coluna, valor in (('LOCAL', local), ('CULTURA', cultura)):
+    if valor is not None:
+      valor = [valor] if isinstance(valor, str) else list(valor)
+      filtros.append('{} IN ({})'.format(coluna, ', '.join('?' * len(valor))))
+      parametros.extend(valor)
+  if ano_inicial is not None:
+    filtros.append('DATA_PLANTIO >= ?')
+    parametros.append('{:04d}-01-01'.format(ano_inicial))
+  if ano_final is not None:
+    filtros.append('DATA_PLANTIO < ?')
+    parametros.append('{:04d}-01-01'.format(ano_final + 1))
+  return (' WHERE ' + ' AND '.join(filtros) if filtros else ''), parametros
+
+def _formatos(conn):
+  """
+  Lê o tipo numpy de cada série diária na tabela results_formato. Bancos sem essa tabela usam float64.
+  :parâmetro conn: conexão com o banco de dados.
+  :return: dicionário coluna -> dtype.
+  """
+  formatos = {coluna: np.dtype(float) for coluna in COLUNAS_SERIES}
+  if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='results_formato'").fetchone():
+    formatos.update((coluna, np.dtype(dtype)) for coluna, dtype in conn.execute('SELECT COLUNA, DTYPE FROM results_formato'))
+  return formatos
+
+class LeitorResultados:
+  """
+  Leitura sob demanda das séries diárias da tabela results.
+  Cada consulta lê apenas a coluna pedida, linha a linha, e devolve arrays numpy somente leitura construídos
+  diretamente sobre os bytes do BLOB (sem cópia), com o tipo registrado em results_formato. Assim, varreduras
+  sobre muitos cenários mantêm na memória apenas as séries em uso.
+
+    leitor = LeitorResultados(database_path)
+    for id_cenario, irrigacao in leitor.series('I', local='MUCURI'):
+      ...
+  """
+
+  def __init__(self, database_path):
+    """
+    :parâmetro database_path: caminho para o banco de dados
+    """
+    self.database_path = database_path
+    self.conn = sqlite3.connect(database_path)
+    self.formatos = _formatos(self.conn)
+    self.id_results = _coluna_id(self.conn)
+
+  def cenarios(self, local=None, cultura=None, ano_inicial=None, ano_final=None):
+    """
+    Dados de cada cenário, sem as séries diárias.
+    :parâmetro local, cultura, ano_inicial, ano_final: filtros, como em consulta_resultados().
+    :return: dataframe com ID e as colunas escalares de results, com a coluna DIAS (duração do cultivo).
+    """
+    where, parametros = _filtros_sql(local, cultura, ano_inicial, ano_final)
+    colunas = [coluna for coluna in COLUNAS_RESULTADOS if coluna not in COLUNAS_SERIES]
+    sql = 'SELECT {0}, {1} FROM results{2} ORDER BY {0}'.format(self.id_results, ', '.join(colunas), where)
+    df = pd.DataFrame(self.conn.execute(sql, parametros).fetchall(), columns=['ID'] + colunas)
+    df['DIAS'] = df['PERIODO_INICIAL'] + df['PERIODO_DESENVOLVIMENTO'] + df['PERIODO_MEDIO'] + df['PERIODO_FINAL']
+    return df
+
+  def series(self, variavel, local=None, cultura=None, ano_inicial=None, ano_final=None):
+    """
+    Percorre uma série diária cenário a cenário.
+    :parâmetro variavel: coluna de COLUNAS_SERIES (ETO, PRECIPITACAO, KC, ZR, ..., UA).
+    :parâmetro local, cultura, ano_inicial, ano_final: filtros, como em consulta_resultados().
+    :return: gerador de tuplas (ID, array somente leitura).
+    """
+    if variavel not in COLUNAS_SERIES:
+      raise ValueError('{} não é uma série diária da tabela results'.format(variavel))
+    where, parametros = _filtros_sql(local, cultura, ano_inicial, ano_final)
+    dtype = self.formatos[variavel]
+    cursor = self.conn.execute('SELECT {0}, {1} FROM results{2} ORDER BY {0}'.format(self.id_results, variavel, where), parametros)
+    for id_cenario, valor in cursor:
+      yield id_cenario, np.frombuffer(valor, dtype=dtype)
+
+  def serie(self, id_cenario, variavel):
+    """
+    Série diária de um único cenário.
+    :parâmetro id_cenario: ID do cenário.
+    :parâmetro variavel: coluna de COLUNAS_SERIES.
+    :return: array somente leitura.
+    """
+    if variavel not in COLUNAS_SERIES:
+      raise ValueError('{} não é uma série diária da tabela results'.format(variavel))
+    linha = self.conn.execute('SELECT {} FROM results WHERE {} = ?'.format(variavel, self.id_results), (id_cenario,)).fetchone()
+    if linha is None:
+      raise KeyError(id_cenario)
+    return np.frombuffer(linha[0], dtype=self.formatos[variavel])
+
+  def agrega(self, variavel, funcao=np.sum, local=None, cultura=None, ano_inicial=None, ano_final=None):
+    """
+    Aplica uma função de redução à série diária de cada cenário, sem manter as séries na memória.
+    :parâmetro variavel: coluna de COLUNAS_SERIES.
+    :parâmetro funcao: função aplicada a cada série (padrão: soma).
+    :parâmetro local, cultura, ano_inicial, ano_final: filtros, como em consulta_resultados().
+    :return: série pandas indexada pelo ID do cenário.
+    """
+    valores = {id_cenario: funcao(serie) for id_cenario, serie in self.series(variavel, local, cultura, ano_inicial, ano_final)}
+    return pd.Series(valores, name=variavel, dtype=float).rename_axis('ID')
+
+  def fecha(self):
+    """
+    Fecha a conexão.
+    """
+    self.conn.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, tipo, valor, traceback):
+    self.fecha()
+
+def _valores_linha(linha):
+  """
+  Converte um resultado de balanco() na tupla de valores da tabela results.
+  :parâmetro linha: dicionário com as colunas de COLUNAS_RESULTADOS.
+  :return: tupla na ordem de COLUNAS_RESULTADOS, com as séries diárias convertidas em bytes float64 (tipo registrado
+           em results_formato).
+  """
+  return tuple(np.asarray(linha[coluna], dtype=float).tobytes() if coluna in COLUNAS_SERIES else linha[coluna]
+               for coluna in COLUNAS_RESULTADOS)
+
+class GravadorResultados:
+  """
+  Grava resultados de balanco() em lote, com uma única conexão ao banco de dados.
+  As linhas são acumuladas e gravadas com executemany em uma transação a cada tamanho_lote linhas
+  (e ao chamar descarrega() ou fecha()), junto com o resumo de cada cenário em results_resumo. O banco usa journal WAL e os pragmas synchronous e cache_size informados.
+  Pode ser passado no lugar de database_path em balanco() e usado como gerenciador de contexto:
+
+    with GravadorResultados(database_path) as gravador:
+      balanco(..., data_in, gravador)
+  """
+
+  def __init__(self, database_path, tamanho_lote=1000, synchronous='NORMAL', cache_size=-65536, journal_mode='WAL'):
+    """
+    :parâmetro database_path: caminho para o banco de dados
+    :parâmetro tamanho_lote: número de linhas acumuladas antes de cada gravação.
+    :parâmetro synchronous: valor do PRAGMA synchronous (OFF, NORMAL, FULL).
+    :parâmetro cache_size: valor do PRAGMA cache_size (negativo: tamanho em KiB).
+    :parâmetro journal_mode: valor do PRAGMA journal_mode.
+    """
+    self.database_path = database_path
+    self.tamanho_lote = tamanho_lote
+    self.linhas = []
+    self.resumos = []
+    self.conn = sqlite3.connect(database_path)
+    self.conn.execute('PRAGMA journal_mode={}'.format(journal_mode))
+    self.conn.execute('PRAGMA synchronous={}'.format(synchronous))
+    self.conn.execute('PRAGMA cache_size={}'.format(int(cache_size)))
+    with self.conn:
+      _cria_tabelas(self.conn)
+
+  def adiciona(self, linha):
+    """
+    Acumula um resultado de balanco() para gravação.
+    :parâmetro linha: dicionário com as colunas de COLUNAS_RESULTADOS.
+    """
+    self.linhas.append(_valores_linha(linha))
+    self.resumos.append(_valores_resumo(linha))
+    if len(self.linhas) >= self.tamanho_lote:
+      self.descarrega()
+
+  @Instrumentacao.medido()
+  def descarrega(self):
+    """
+    Grava as linhas acumuladas em uma única transação.
+    """
+    if self.linhas:
+      with self.conn: # auto-commits
+        #IDs explícitos a partir do maior ID gravado; BEGIN IMMEDIATE reserva a escrita antes da leitura do maior ID,
+        #para que outra conexão não grave no meio do lote
+        self.conn.execute('BEGIN IMMEDIATE')
+        primeiro = self.conn.execute('SELECT COALESCE(MAX(ID), 0) FROM results').fetchone()[0] + 1
+        self.conn.executemany(_SQL_INSERE_RESULTS_ID, [(primeiro + k,) + valores for k, valores in enumerate(self.linhas)])
+        self.conn.executemany(_SQL_INSERE_RESUMO, [(primeiro + k,) + resumo for k, resumo in enumerate(self.resumos)])
+      Instrumentacao.conta('Balanco_Hidrico.sql.instrucoes', 4)
+      Instrumentacao.conta('Balanco_Hidrico.sql.linhas_gravadas', len(self.linhas))
+      self.linhas = []
+      self.resumos = []
+
+  def fecha(self):
+    """
+    Grava as linhas pendentes e fecha a conexão.
+    """
+    self.descarrega()
+    self.conn.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, tipo, valor, traceback):
+    if tipo is None:
+      self.fecha()
+    else:
+      self.conn.close()
+
+def _serie_por_data(serie):
+  """
+  Separa um dataframe (Coluna 0 - Data, Coluna 1 - Valor) em arrays de datas e valores ordenados pela data.
+  :parâmetro serie: dataframe com a série temporal diária.
+  :return: array datetime64 com as datas e array com os valores.
+  """
+  datas = pd.to_datetime(serie.iloc[:,0]).values.astype('datetime64[D]')
+  valores = serie.iloc[:,1].to_numpy(dtype=float)
+  ordem = np.argsort(datas, kind='stable')
+  return datas[ordem], valores[ordem]
+
+@Instrumentacao.medido()
+def varredura(locais, culturas, datas_plantio):
+  """
+  Balanço de irrigação para todas as combinações de locais, culturas e datas de plantio em uma única chamada.
+  As séries climáticas de cada local são ordenadas uma vez e recortadas por deslocamento de índice; todos os
+  cultivos são simulados juntos em matrizes (cenário x dia), com o mesmo resultado de balanco().
+  :parâmetro locais: lista de dicionários com LOCAL (nome), P (dataframe de precipitação) e ETO (dataframe de ETo),
+                     no mesmo formato dos parâmetros P e eto de balanco().
+  :parâmetro culturas: lista de dicionários com CULTURA, theta_fc, theta_wp, p, periodo, z_etapas, forma_z, kc_etapas e forma_kc,
+                       como em balanco().
+  :parâmetro datas_plantio: lista de dicionários com dia, mes e ano do início do cultivo.
+  :return: dataframe com um cenário por linha (LOCAL, CULTURA, DATA_PLANTIO, THETA_FC, THETA_WP, P, DIAS) e dicionário
+           com as matrizes (cenário x dia) de ETO, PRECIPITACAO, KC, ZR, ADT, AFA, DIN, DFIM, KS, I, DP, ETCA, FC, PMP, F e UA.
+           Dias além do fim de cada cultivo recebem NaN.
+  """
+  cenarios = list(itertools.product(locais, culturas, datas_plantio))
+  dias = np.array([sum(cultura['periodo'].values()) for _, cultura, _ in cenarios])
+  Instrumentacao.conta('Balanco_Hidrico.cultivos', len(cenarios))
+  Instrumentacao.conta('Balanco_Hidrico.dias', int(dias.sum()))
+  n_dias = dias.max()
+  dia = np.arange(n_dias)
+  no_cultivo = dia < dias.reshape(-1, 1)
   #------------------------------------
-  result_kc, result_Zr, result_adt, result_afa = np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]])
-  result_din, result_dfim, result_ks = np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]])
-  result_I, result_dp, result_etca, result_FC =  np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]])
-  result_PMP, result_F, result_UA = np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]]), np.empty([1,eto.shape[0]])
+  eto, P = np.empty((len(cenarios), n_dias)), np.empty((len(cenarios), n_dias))
+  kc, Zr = np.full((len(cenarios), n_dias), np.nan), np.full((len(cenarios), n_dias), np.nan)
+  series, curvas, linhas = {}, {}, []
+  for c, (local, cultura, data) in enumerate(cenarios):
+    if id(local) not in series:
+      series[id(local)] = (_serie_por_data(local['ETO']), _serie_por_data(local['P']))
+    data_in = datetime.datetime(data['ano'], data['mes'], data['dia'])
+    inicio = np.datetime64(data_in.date(), 'D')
+    for destino, (datas, valores) in zip((eto, P), series[id(local)]):
+      indice = np.searchsorted(datas, inicio) + dia
+      valido = indice < datas.shape[0]
+      indice = np.where(valido, indice, datas.shape[0] - 1)
+      if not (valido & (datas[indice] == inicio + dia))[:dias[c]].all():
+        raise ValueError('As séries de ETo e precipitação de {} não cobrem os {} dias do cultivo a partir de {}'.format(local['LOCAL'], dias[c], data_in))
+      destino[c] = valores[indice]
+    if id(cultura) not in curvas:
+      curvas[id(cultura)] = (curva_etapas(cultura['periodo'], cultura['kc_etapas'], cultura['forma_kc']),
+                             curva_etapas(cultura['periodo'], cultura['z_etapas'], cultura['forma_z']))
+    kc[c, :dias[c]], Zr[c, :dias[c]] = curvas[id(cultura)]
+    linhas.append((local['LOCAL'], cultura['CULTURA'], data_in, cultura['theta_fc'], cultura['theta_wp'], cultura['p'], dias[c]))
   #------------------------------------
-  for j, i in enumerate(data_list):
-    kc = interpolacao(i, periodo, kc_etapas, forma_kc, data_in)
-    Zr = interpolacao(i, periodo, z_etapas, forma_z, data_in)
-    adt = ADT(theta_fc, theta_wp, Zr)
-    afa = AFA(p , ADT= adt)
-    if j != 0:
-      din = Din(P[j], dfim)
-    ks = Ks(din, adt, afa)
-    etca = Etca(eto[j], kc, ks)
-    I = Irrigacao(din, afa, etca)
-    dp = DP(P[j], I, etca, dfim)
-    dfim = Dfim(dfim, P[j], I, etca, dp)
-    FC = Zr * theta_fc * 1000
-    PMP = Zr * theta_wp * 1000
-    F = FC - (FC - PMP) * p
-    UA = FC - din 
-    #------------------------------------
-    result_din[0][j] = din
-    result_kc[0][j] = kc
-    result_Zr[0][j] = Zr
-    result_adt[0][j] = adt
-    result_afa[0][j] = afa
-    result_dfim[0][j] = dfim
-    result_ks[0][j] = ks
-    result_I[0][j] = I
-    result_dp[0][j] = dp
-    result_etca[0][j] = etca
-    result_FC[0][j] = FC
-    result_PMP[0][j] = PMP
-    result_F[0][j] = F
-    result_UA[0][j] = UA
-    #------------------------------------
-  execute("""CREATE TABLE IF NOT EXISTS results(LOCAL TEXT, CULTURA TEXT, DATA_PLANTIO TEXT,
-                                              KC_INICIAL INT, KC_MEDIO INT, KC_FINAL INT,
-                                              ZR_INICIAL INT, ZR_MEDIO INT, ZR_FINAL INT,
-                                              PERIODO_INICIAL INT, PERIODO_DESENVOLVIMENTO INT, PERIODO_MEDIO INT, PERIODO_FINAL INT,
-                                              P FLOAT, THETA_FC FLOAT, THETA_WP FLOAT,
-                                              ETO BLOB, PRECIPITACAO BLOB,
-                                              KC BLOB, ZR BLOB, ADT BLOB, AFA BLOB, DIN BLOB, DFIM BLOB, KS BLOB,
-                                              I BLOB, DP BLOB, ETCA BLOB, FC BLOB, PMP BLOB, F BLOB, UA BLOB
-                                              )""", database_path)
-
-  
-  execute_insert("""INSERT INTO results VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                                               ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 
-                                               ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-              ,(local, cultura, data_in, 
-                kc_etapas['inicial'], kc_etapas['media'], kc_etapas['final'], 
-                z_etapas['inicial'], z_etapas['media'], z_etapas['final'],
-                periodo['inicial'], periodo['desenvolvimento'], periodo['media'], periodo['final'], 
-                p, theta_fc, theta_wp, 
-                eto.tobytes(), P.tobytes(),
-                result_kc.tobytes(), result_Zr.tobytes(), result_adt.tobytes(), result_afa.tobytes(),
-                result_din.tobytes(), result_dfim.tobytes(), result_ks.tobytes(), 
-                result_I.tobytes(), result_dp.tobytes(), result_etca.tobytes(), result_FC.tobytes(), 
-                result_PMP.tobytes(), result_F.tobytes(), result_UA.tobytes()
-                ), database_path)
-
-  
-  return
+  cenarios = pd.DataFrame(linhas, columns=['LOCAL', 'CULTURA', 'DATA_PLANTIO', 'THETA_FC', 'THETA_WP', 'P', 'DIAS'])
+  resultado = _balanco_diario_lote(eto, P, kc, Zr,
+                                   cenarios['THETA_FC'].to_numpy().reshape(-1, 1),
+                                   cenarios['THETA_WP'].to_numpy().reshape(-1, 1),
+                                   cenarios['P'].to_numpy().reshape(-1, 1))
+  resultado = dict({'ETO': eto, 'PRECIPITACAO': P}, **resultado)
+  for variavel in resultado.values():
+    variavel[~no_cultivo] = np.nan
+  return cenarios, resultado
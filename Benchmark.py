@@ -0,0 +1,338 @@
+"""
+Benchmarks das funções principais: importação dos módulos, ETo, ajustes da base de dados, balanço hídrico, SQLite e leitura das bases.
+Usa apenas as bases de dados da pasta Datasets (sem acesso à rede).
+Uso:
+  python Benchmark.py                               #executa todos os casos e mostra os tempos
+  python Benchmark.py --salvar base.json            #grava os resultados como referência
+  python Benchmark.py --comparar base.json          #compara com a referência; sai com código 1 se houver regressão
+  python Benchmark.py --casos eto_dia balanco_safra --repeticoes 50
+  python Benchmark.py --instrumentacao relatorio.json  #executa cada caso uma vez instrumentado e grava o relatório
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import functools
+import tracemalloc
+import numpy as np
+import pandas as pd
+import Ajuste
+import Calcula_ETo
+import Balanco_Hidrico
+import Carrega_dataset
+import Instrumentacao
+
+PASTA_DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Datasets')
+
+#Bases de dados da NASA POWER + CHIRPS e coordenadas dos pontos (Experimentos.ipynb)
+PONTOS = {'MUCURI': {'arquivo': 'dataset_mucuri.csv', 'LATITUDE': -17.7031, 'ALTITUDE': 277.78},
+          'RIO DOCE': {'arquivo': 'dataset_riodoce.csv', 'LATITUDE': -18.8633, 'ALTITUDE': 325.67},
+          'JEQUITINHONHA': {'arquivo': 'dataset_jequitinhonha.csv', 'LATITUDE': -16.1133, 'ALTITUDE': 797.53}}
+#: Solar constant [ MJ m-2 min-1]
+GSC = 0.0820
+# Stefan Boltzmann constant [MJ K-4 m-2 dia-1]
+SIGMA = 0.000000004903
+G = 0
+
+#Cultura usada nos casos de balanço hídrico (Exemplo_balanco.ipynb)
+CULTURA = {'CULTURA': 'MILHO', 'theta_fc': 0.23, 'theta_wp': 0.1, 'p': 0.5,
+           'periodo': {'inicial': 15, 'desenvolvimento': 30, 'media': 60, 'final': 15},
+           'z_etapas': {'inicial': 0.15, 'media': 0.40, 'final': 0.30},
+           'forma_z': {'inicial': True, 'desenvolvimento': False, 'media': True, 'final': False},
+           'kc_etapas': {'inicial': 0.5, 'media': 1.2, 'final': 0.8},
+           'forma_kc': {'inicial': True, 'desenvolvimento': False, 'media': True, 'final': False}}
+
+#Datas de plantio da varredura: 10 por ano de 1990 a 2019 (x 3 pontos = 900 cultivos)
+DATAS_PLANTIO = [{'dia': dia, 'mes': mes, 'ano': ano} for ano in range(1990, 2020)
+                 for dia, mes in [(1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (1, 7), (1, 8), (1, 9), (1, 10)]]
+
+#Módulos do núcleo numérico (importados apenas com numpy e pandas) e módulos carregados somente quando usados
+MODULOS_NUCLEO = ['Ajuste', 'Calcula_ETo', 'Balanco_Hidrico']
+MODULOS_SOB_DEMANDA = ['matplotlib', 'seaborn', 'ee', 'ipygee', 'requests', 'streamlit', 'PIL', 'IPython']
+
+#Percentis dos tempos registrados e aumento relativo da mediana considerado regressão
+PERCENTIS = (10, 50, 90)
+LIMITE_REGRESSAO = 0.25
+
+_temporaria = tempfile.TemporaryDirectory()
+
+#------------> Dados de entrada, preparados uma única vez
+
+@functools.lru_cache(maxsize=None)
+def _datasets():
+  """
+  Lê as bases de dados dos pontos.
+  :return: dicionário nome do ponto -> dataframe.
+  """
+  return {nome: pd.read_csv(os.path.join(PASTA_DATASETS, ponto['arquivo'])) for nome, ponto in PONTOS.items()}
+
+def _serie_eto(nome):
+  """
+  Série de ETo de um ponto.
+  :parâmetro nome: nome do ponto em PONTOS.
+  :return: array com a ETo diária.
+  """
+  dataset, ponto = _datasets()[nome], PONTOS[nome]
+  J = pd.to_datetime(dataset['DATA']).dt.dayofyear
+  return Calcula_ETo.gera_serie(dataset['T2M_MIN'], dataset['T2M_MAX'], dataset['RH2M'], dataset['WS2M'], J,
+                                ponto['LATITUDE'], ponto['ALTITUDE'], GSC, SIGMA, G, dataset['T2M'], None,
+                                dataset['ALLSKY_SFC_SW_DWN'])
+
+@functools.lru_cache(maxsize=None)
+def _locais():
+  """
+  Séries de ETo e precipitação dos pontos no formato de entrada de balanco() e varredura().
+  :return: lista de dicionários com LOCAL, P e ETO.
+  """
+  locais = []
+  for nome, dataset in _datasets().items():
+    datas = pd.to_datetime(dataset['DATA'])
+    locais.append({'LOCAL': nome, 'P': pd.DataFrame({'DATA': datas, 'P': dataset['P']}),
+                   'ETO': pd.DataFrame({'DATA': datas, 'ETO': _serie_eto(nome)})})
+  return locais
+
+def _balanco(local, data_in):
+  """
+  Balanço hídrico em memória de um cultivo de CULTURA.
+  :parâmetro local: dicionário com LOCAL, P e ETO.
+  :parâmetro data_in: data de plantio (dicionário com dia, mes e ano).
+  :return: dicionário retornado por balanco().
+  """
+  c = CULTURA
+  return Balanco_Hidrico.balanco(local['LOCAL'], c['CULTURA'], c['theta_fc'], c['theta_wp'], c['p'], local['P'], local['ETO'],
+                                 c['periodo'], c['z_etapas'], c['forma_z'], c['kc_etapas'], c['forma_kc'], data_in, None)
+
+@functools.lru_cache(maxsize=None)
+def _linhas():
+  """
+  Resultados dos 900 cultivos da varredura, no formato de balanco().
+  :return: lista de dicionários.
+  """
+  return [_balanco(local, data) for local in _locais() for data in DATAS_PLANTIO]
+
+@functools.lru_cache(maxsize=None)
+def _banco():
+  """
+  Banco de dados com os 900 cultivos, usado nos casos de leitura.
+  :return: caminho do banco de dados.
+  """
+  caminho = os.path.join(_temporaria.name, 'leitura.db')
+  with Balanco_Hidrico.GravadorResultados(caminho) as gravador:
+    for linha in _linhas():
+      gravador.adiciona(linha)
+  return caminho
+
+def _novo_banco():
+  """
+  Caminho de um banco de dados ainda não criado.
+  :return: caminho do banco de dados.
+  """
+  arquivo = tempfile.NamedTemporaryFile(suffix='.db', dir=_temporaria.name, delete=False)
+  arquivo.close()
+  os.remove(arquivo.name)
+  return arquivo.name
+
+def _importa(modulos):
+  """
+  Importa módulos em um novo interpretador Python e verifica que nenhum módulo de MODULOS_SOB_DEMANDA foi carregado.
+  :parâmetro modulos: lista com o nome dos módulos.
+  """
+  codigo = ('import sys\n' + ''.join('import {}\n'.format(modulo) for modulo in modulos) +
+            'carregados = [m for m in {!r} if m in sys.modules]\n'.format(MODULOS_SOB_DEMANDA) +
+            'if carregados: sys.exit("Módulos carregados na importação: " + ", ".join(carregados))\n')
+  resultado = subprocess.run([sys.executable, '-c', codigo], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+  if resultado.returncode:
+    raise RuntimeError(resultado.stderr.strip())
+
+#------------> Casos: cada função prepara as entradas (fora da medição) e retorna a função medida
+
+def caso_importacao_python():
+  return lambda: _importa([])
+
+def caso_importacao_nucleo():
+  return lambda: _importa(MODULOS_NUCLEO)
+
+def caso_importacao_upload():
+  return lambda: _importa(['Upload_dataset'])
+
+def caso_eto_dia():
+  return lambda: Calcula_ETo.gera_serie(19.1, 31.4, 75.9, 1.1, '01/01/2020', -15.7, 850.06, GSC, SIGMA, G)
+
+def caso_eto_serie_30anos():
+  _datasets()
+  return lambda: _serie_eto('MUCURI')
+
+def caso_ajuste_dataset():
+  dataset = pd.read_csv(os.path.join(PASTA_DATASETS, 'RIO_PARDO_MINAS_INMET.csv'), delimiter=';')
+  return lambda: Ajuste.ajusta_dataset(dataset, z=10)
+
+def caso_balanco_safra():
+  local = _locais()[0]
+  return lambda: _balanco(local, {'dia': 1, 'mes': 10, 'ano': 2005})
+
+def caso_varredura_900():
+  locais = _locais()
+  return lambda: Balanco_Hidrico.varredura(locais, [CULTURA], DATAS_PLANTIO)
+
+def caso_sqlite_gravacao():
+  linhas, caminho = _linhas(), _novo_banco()
+  def grava():
+    with Balanco_Hidrico.GravadorResultados(caminho) as gravador:
+      for linha in linhas:
+        gravador.adiciona(linha)
+  return grava
+
+def caso_sqlite_leitura():
+  caminho = _banco()
+  return lambda: Balanco_Hidrico.consulta_resultados(caminho, ['I', 'ETCA'], local='MUCURI')
+
+def caso_csv_leitura():
+  caminhos = [os.path.join(PASTA_DATASETS, ponto['arquivo']) for ponto in PONTOS.values()]
+  return lambda: [pd.read_csv(caminho, parse_dates=['DATA']) for caminho in caminhos]
+
+def caso_csv_cache():
+  caminhos = [os.path.join(PASTA_DATASETS, ponto['arquivo']) for ponto in PONTOS.values()]
+  pasta = os.path.join(_temporaria.name, 'cache')
+  for caminho in caminhos:
+    Carrega_dataset.carrega_dataset(caminho, pasta)
+  return lambda: [Carrega_dataset.carrega_dataset(caminho, pasta) for caminho in caminhos]
+
+CASOS = {'importacao_python': caso_importacao_python, 'importacao_nucleo': caso_importacao_nucleo,
+         'importacao_upload': caso_importacao_upload, 'eto_dia': caso_eto_dia, 'eto_serie_30anos': caso_eto_serie_30anos, 'ajuste_dataset': caso_ajuste_dataset,
+         'balanco_safra': caso_balanco_safra, 'varredura_900': caso_varredura_900, 'sqlite_gravacao': caso_sqlite_gravacao,
+         'sqlite_leitura': caso_sqlite_leitura, 'csv_leitura': caso_csv_leitura, 'csv_cache': caso_csv_cache}
+
+#------------> Medição, referência e comparação
+
+def mede(preparar, repeticoes=20, aquecimento=1):
+  """
+  Mede o tempo de execução e o pico de memória de um caso.
+  :parâmetro preparar: função que prepara as entradas e retorna a função medida.
+  :parâmetro repeticoes: número de execuções medidas.
+  :parâmetro aquecimento: número de execuções iniciais descartadas.
+  :return: dicionário com repeticoes, os percentis (p10, p50, p90) e o mínimo dos tempos [s] e pico_memoria [bytes].
+  """
+  tempos = []
+  for i in range(aquecimento + repeticoes):
+    funcao = preparar()
+    inicio = time.perf_counter()
+    funcao()
+    segundos = time.perf_counter() - inicio
+    if i >= aquecimento:
+      tempos.append(segundos)
+  #O pico de memória é medido em uma execução separada, pois o tracemalloc deixa a execução mais lenta
+  funcao = preparar()
+  tracemalloc.start()
+  try:
+    funcao()
+    pico = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+  resultado = {'repeticoes': repeticoes, 'minimo': float(np.min(tempos))}
+  resultado.update({'p%d' % q: float(v) for q, v in zip(PERCENTIS, np.percentile(tempos, PERCENTIS))})
+  resultado['pico_memoria'] = int(pico)
+  return resultado
+
+def executa(casos=None, repeticoes=20):
+  """
+  Executa os casos de benchmark.
+  :parâmetro casos: lista com o nome dos casos. Se None, todos os casos de CASOS.
+  :parâmetro repeticoes: número de execuções medidas por caso.
+  :return: dicionário nome do caso -> resultado de mede().
+  """
+  return {nome: mede(CASOS[nome], repeticoes) for nome in (casos or CASOS)}
+
+def ambiente():
+  """
+  Descrição do ambiente de execução, gravada junto da referência.
+  :return: dicionário com as versões do Python, numpy e pandas e a plataforma.
+  """
+  return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+          'plataforma': platform.platform(), 'processador': platform.processor()}
+
+def salva(resultados, caminho):
+  """
+  Grava os resultados como referência (JSON).
+  :parâmetro resultados: resultado de executa().
+  :parâmetro caminho: caminho do arquivo JSON.
+  """
+  with open(caminho, 'w') as arquivo:
+    json.dump({'ambiente': ambiente(), 'casos': resultados}, arquivo, indent=1)
+
+def compara(resultados, caminho, limite=LIMITE_REGRESSAO):
+  """
+  Compara a mediana de cada caso com a referência gravada por salva().
+  :parâmetro resultados: resultado de executa(); recebe a razão entre as medianas em cada caso comparado.
+  :parâmetro caminho: caminho do arquivo JSON de referência.
+  :parâmetro limite: aumento relativo da mediana considerado regressão.
+  :return: lista com o nome dos casos com regressão.
+  """
+  with open(caminho, 'r') as arquivo:
+    referencia = json.load(arquivo)['casos']
+  regressoes = []
+  for nome, resultado in resultados.items():
+    if nome in referencia:
+      resultado['razao'] = resultado['p50'] / referencia[nome]['p50']
+      if resultado['razao'] > 1 + limite:
+        regressoes.append(nome)
+  return regressoes
+
+def tabela(resultados):
+  """
+  Tabela dos resultados para exibição (tempos em ms e memória em KiB).
+  :parâmetro resultados: resultado de executa().
+  :return: dataframe com um caso por linha.
+  """
+  df = pd.DataFrame(resultados).T
+  df['repeticoes'] = df['repeticoes'].astype(int)
+  for coluna in ['minimo'] + ['p%d' % q for q in PERCENTIS]:
+    df[coluna] = df[coluna].astype(float) * 1000
+  df['pico_memoria'] = df['pico_memoria'].astype(float) / 1024
+  return df.rename(columns={'minimo': 'minimo_ms', 'pico_memoria': 'pico_memoria_KiB',
+                            **{'p%d' % q: 'p%d_ms' % q for q in PERCENTIS}})
+
+def instrumenta(casos, caminho):
+  """
+  Executa cada caso uma vez com a instrumentação ligada, mostra os tempos por etapa e grava o relatório.
+  :parâmetro casos: lista com o nome dos casos. Se None, todos os casos de CASOS.
+  :parâmetro caminho: caminho do arquivo JSON do relatório.
+  :return: código de saída (0).
+  """
+  funcoes = [CASOS[nome]() for nome in (casos or CASOS)]
+  with Instrumentacao.ativado() as instrumentacao:
+    for funcao in funcoes:
+      funcao()
+    print(instrumentacao.relatorio_dataframe().to_string(float_format=lambda v: '%.6f' % v))
+    print(pd.Series(instrumentacao.relatorio()['contadores'], dtype=object).to_string())
+    instrumentacao.exporta(caminho)
+  return 0
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Benchmarks do ETo e do balanço hídrico.')
+  parser.add_argument('--casos', nargs='+', choices=list(CASOS), help='casos executados (padrão: todos)')
+  parser.add_argument('--repeticoes', type=int, default=20, help='execuções medidas por caso')
+  parser.add_argument('--salvar', metavar='JSON', help='grava os resultados como referência')
+  parser.add_argument('--comparar', metavar='JSON', help='compara com a referência e falha se houver regressão')
+  parser.add_argument('--limite', type=float, default=LIMITE_REGRESSAO, help='aumento relativo da mediana tolerado')
+  parser.add_argument('--instrumentacao', metavar='JSON', help='executa cada caso uma vez com a instrumentação ligada')
+  argumentos = parser.parse_args(argumentos)
+  if argumentos.instrumentacao:
+    return instrumenta(argumentos.casos, argumentos.instrumentacao)
+  resultados = executa(argumentos.casos, argumentos.repeticoes)
+  regressoes = compara(resultados, argumentos.comparar, argumentos.limite) if argumentos.comparar else []
+  print(tabela(resultados).to_string(float_format=lambda v: '%.3f' % v))
+  if argumentos.salvar:
+    salva(resultados, argumentos.salvar)
+  if regressoes:
+    print('Regressão acima de {:.0%} em: {}'.format(argumentos.limite, ', '.join(regressoes)))
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
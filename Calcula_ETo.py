@@ -17,8 +17,19 @@ Fluxo de calor do solo (G) para o período de 1 dia ou 10 dias = 0
 
 import pandas as pd
 import math
+import functools
+import itertools
 import numpy as np
 from datetime import datetime
+import Ajuste
+import Instrumentacao
+
+#Número máximo de estações mantidas em cache pela função tabela_solar()
+TAMANHO_CACHE_SOLAR = 512
+
+#Colunas de uma base de dados da NASA POWER usadas por gera_serie_arquivo()
+COLUNAS_NASA_POWER = {'DATA': 'DATA', 'Tmin': 'T2M_MIN', 'Tmax': 'T2M_MAX', 'Tmedia': 'T2M', 'UR': 'RH2M',
+                      'U2': 'WS2M', 'Insolacao': None, 'Radiacao': 'ALLSKY_SFC_SW_DWN'}
 
 def Pressao_atm(altitude):
     """
@@ -27,7 +38,7 @@ def Pressao_atm(altitude):
     :return: pressão atmosférica [kPa]
     """
     tmp = (293.0 - (0.0065 * altitude)) / 293.0
-    return math.pow(tmp, 5.26) * 101.3
+    return np.power(tmp, 5.26) * 101.3
     
 def psicrometrica(pressao_atm):
     """
@@ -43,7 +54,7 @@ def Es(t):
     :parâmetro t: temperatura [C]
     :return: pressão de vapor saturado [kPa]
     """
-    return 0.6108 * math.exp((17.27 * t) / (t + 237.3))
+    return 0.6108 * np.exp((17.27 * t) / (t + 237.3))
     
 def Es_medio(tmin, tmax):
     """
@@ -59,8 +70,8 @@ def Delta_medio(tmedia):
     :parâmetro t: Temperatura média [C].
     :return: declividade da curva de pressão do valor de saturação [kPa C-1]
     """
-    tmp = 4098 * (0.6108 * math.exp((17.27 * tmedia) / (tmedia + 237.3)))
-    return tmp / math.pow((tmedia + 237.3), 2)
+    tmp = 4098 * (0.6108 * np.exp((17.27 * tmedia) / (tmedia + 237.3)))
+    return tmp / np.power((tmedia + 237.3), 2)
 
 def Delta(tmin, tmax):
     """
@@ -69,8 +80,8 @@ def Delta(tmin, tmax):
     :return: declividade da curva de pressão do valor de saturação [kPa C-1]
     """
     tmedia = tmin + tmax / 2
-    tmp = 4098 * (0.6108 * math.exp((17.27 * tmedia) / (tmedia + 237.3)))
-    return tmp / math.pow((tmedia + 237.3), 2)
+    tmp = 4098 * (0.6108 * np.exp((17.27 * tmedia) / (tmedia + 237.3)))
+    return tmp / np.power((tmedia + 237.3), 2)
 
 def Ea(tmin, tmax, RH):
     """
@@ -81,10 +92,9 @@ def Ea(tmin, tmax, RH):
     :parâmetro RH: umidade relativa média [%]
     :return: pressão de vapor atual [kPa]
     """
-    if np.isnan(RH):
-        ea = 0.611 * math.exp((17.27 * tmin) / (tmin + 237.3))
-    else:
-        ea = (RH * Es_medio(tmax,tmin))/ 100.0
+    ea = np.where(np.isnan(RH),
+                  0.611 * np.exp((17.27 * tmin) / (tmin + 237.3)),
+                  (RH * Es_medio(tmax,tmin))/ 100.0)
     return ea
     
 def Ra(latitude, declinacao_sol, omega, dr, Gsc):
@@ -98,8 +108,8 @@ def Ra(latitude, declinacao_sol, omega, dr, Gsc):
     """
 
     tmp1 = (24.0 * 60.0) / math.pi
-    tmp2 = omega * math.sin(latitude) * math.sin(declinacao_sol)
-    tmp3 = math.cos(latitude) * math.cos(declinacao_sol) * math.sin(omega)
+    tmp2 = omega * np.sin(latitude) * np.sin(declinacao_sol)
+    tmp3 = np.cos(latitude) * np.cos(declinacao_sol) * np.sin(omega)
     return tmp1 * Gsc * dr * (tmp2 + tmp3)
     
 def Declinacao_sol(J):
@@ -107,7 +117,7 @@ def Declinacao_sol(J):
     :parâmetro J: dia do ano, inteiro de 1 a 365 ou 366.
     :return: declinação solar [rad]
     """
-    return float(0.409) * math.sin(((float(2.0) * math.pi / float(365.0)) * J - float(1.39)))
+    return float(0.409) * np.sin(((float(2.0) * math.pi / float(365.0)) * J - float(1.39)))
     
 def Omega(latitude, declinacao_sol):
     """
@@ -116,15 +126,15 @@ def Omega(latitude, declinacao_sol):
     :return: ângulo horário pôr-do-sol [rad].
     """
 
-    cos_sha = -math.tan(latitude) * math.tan(declinacao_sol)
-    return math.acos(min(max(float(cos_sha), float(-1.0)), float(1.0)))
+    cos_sha = -np.tan(latitude) * np.tan(declinacao_sol)
+    return np.arccos(np.clip(cos_sha, float(-1.0), float(1.0)))
     
 def Dr(J):
     """
     :parâmetro J: dia do ano, inteiro de 1 a 365 ou 366.
     :return: inverso da distância relativa da terra-sol.
     """
-    return 1 + (0.033 * math.cos((2.0 * math.pi / 365.0) * J))
+    return 1 + (0.033 * np.cos((2.0 * math.pi / 365.0) * J))
     
 def N_insolacao(omega):
     """
@@ -188,8 +198,8 @@ def Rnl(tmin, tmax, rs, rso, ea, sigma):
     tmax_k = tmax + 273.16 #----Converte a temperatura de °C para °K
     tmin_k = tmin + 273.16 #----Converte a temperatura de °C para °K
     
-    tmp1 = (sigma * ((math.pow(tmax_k, 4) + math.pow(tmin_k, 4)) / 2))
-    tmp2 = (0.34 - (0.14 * math.sqrt(ea)))
+    tmp1 = (sigma * ((np.power(tmax_k, 4) + np.power(tmin_k, 4)) / 2))
+    tmp2 = (0.34 - (0.14 * np.sqrt(ea)))
     tmp3 = 1.35 * (rs / rso) - 0.35
     return tmp1 * tmp2 * tmp3
 
@@ -206,8 +216,8 @@ def Rnl_medio(tmean, rs, rso, ea, sigma):
     tmax_k = tmean + 273.16 #----Converte a temperatura de °C para °K
     tmin_k = tmean + 273.16 #----Converte a temperatura de °C para °K
     
-    tmp1 = (sigma * ((math.pow(tmax_k, 4) + math.pow(tmin_k, 4)) / 2))
-    tmp2 = (0.34 - (0.14 * math.sqrt(ea)))
+    tmp1 = (sigma * ((np.power(tmax_k, 4) + np.power(tmin_k, 4)) / 2))
+    tmp2 = (0.34 - (0.14 * np.sqrt(ea)))
     tmp3 = 1.35 * (rs / rso) - 0.35
     return tmp1 * tmp2 * tmp3
     
@@ -256,6 +266,63 @@ def fao56_penman_monteith_T(rn, tmin, tmax, U2, es, ea, delta, gamma, G):
     a2 =  a1 / (delta + (gamma * (1 + 0.34 * U2)))
     return a2
     
+@functools.lru_cache(maxsize=TAMANHO_CACHE_SOLAR)
+def tabela_solar(latitude, altitude, Gsc):
+    """
+    Tabela com a geometria solar da estação para os dias do ano 1 a 366.
+    Os valores dependem apenas da latitude, da altitude e do dia do ano, portanto são calculados
+    uma única vez por estação e reaproveitados entre chamadas (cache LRU limitado a TAMANHO_CACHE_SOLAR estações).
+    :parâmetro latitude: latitude [rad]
+    :parâmetro altitude: altitude acima do nível do mar [m]
+    :parâmetro Gsc: Constante Solar [MJ m-2 min-1]
+    :return: dicionário com arrays somente leitura de 366 posições (índice J - 1):
+             declinacao_sol, dr, omega, ra, N e rso.
+    """
+    Instrumentacao.conta('Calcula_ETo.tabela_solar.falhas')
+    J = np.arange(1, 367, dtype=float)
+    declinacao_sol = Declinacao_sol(J)
+    omega = Omega(latitude, declinacao_sol)
+    dr = Dr(J)
+    ra = Ra(latitude, declinacao_sol, omega, dr, Gsc)
+    tabela = {'declinacao_sol': declinacao_sol, 'dr': dr, 'omega': omega, 'ra': ra,
+              'N': N_insolacao(omega), 'rso': Rso(altitude, ra)}
+    for valores in tabela.values():
+        valores.flags.writeable = False
+    return tabela
+
+def tabelas_solares(latitudes, altitudes, Gsc):
+    """
+    Geometria solar de várias estações de uma só vez, em matrizes (estação x dia do ano), sem passar pelo cache
+    de tabela_solar(): grades com mais estações que TAMANHO_CACHE_SOLAR descartariam o cache a cada chamada.
+    Ra e N dependem apenas da latitude e são calculados uma vez por latitude distinta.
+    :parâmetro latitudes: latitude de cada estação [rad].
+    :parâmetro altitudes: altitude de cada estação [m], escalar ou uma por estação.
+    :parâmetro Gsc: Constante Solar [MJ m-2 min-1]
+    :return: matrizes (estação x 366, coluna J - 1) de radiação extraterrestre, duração máxima de insolação e
+             radiação de céu claro.
+    """
+    latitudes = np.ravel(latitudes).astype(float)
+    altitudes = np.broadcast_to(np.ravel(altitudes).astype(float), latitudes.shape)
+    unicas, posicao = np.unique(latitudes, return_inverse=True)
+    J = np.arange(1, 367, dtype=float)
+    declinacao_sol = Declinacao_sol(J)
+    omega = Omega(unicas.reshape(-1, 1), declinacao_sol)
+    ra = Ra(unicas.reshape(-1, 1), declinacao_sol, omega, Dr(J), Gsc)
+    ra, N = ra[posicao], N_insolacao(omega)[posicao]
+    return ra, N, Rso(altitudes.reshape(-1, 1), ra)
+
+def info_tabela_solar():
+    """
+    Estatísticas de uso do cache da função tabela_solar().
+    :return: dicionário com acertos, falhas, taxa de acerto, tamanho máximo e número de estações em cache.
+    """
+    info = tabela_solar.cache_info()
+    consultas = info.hits + info.misses
+    return {'acertos': info.hits, 'falhas': info.misses,
+            'taxa_acerto': info.hits / consultas if consultas else 0.0,
+            'tamanho_maximo': info.maxsize, 'estacoes': info.currsize}
+
+@Instrumentacao.medido()
 def gera_serie(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia=None, Insolacao=None, Radiacao=None):
     """
     Gera a série Evapotranspiração de referência (ETo): Equação 6 (FAO 56)
@@ -277,155 +344,212 @@ def gera_serie(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia=None, Inso
     Estimativa de variáveis em caso de dados faltantes:
      - Tmedia: estima-se através de Tmin e Tmax.
      - Radiacao: estima-se através da insolação ou das temperaturas Tmax e Tmin.
+
+    As colunas podem ser pandas Series ou arrays numpy; o cálculo é feito sobre o vetor inteiro
+    e o retorno é um array numpy. Para um único dia, J pode ser a data no formato 'dd/mm/aaaa'
+    e as demais entradas valores escalares; nesse caso o retorno é um valor escalar.
     """
     #Converte a latitude de graus para radianos
     Lat = math.pi/180 * Lat
     
-    try:
-      serie_eto = []
-      for i in range(len(Tmin)):
-          #------------> Pressão do vapor de saturação
-          if np.isnan(Tmin[i]) == True or np.isnan(Tmax[i]) == True:
-              es = Es(Tmedia[i]) 
-          else:
-              es = Es_medio(Tmin[i],Tmax[i]) 
-          
-          #-----------> Pressão do vapor atual
-          ea = Ea(Tmin[i],Tmax[i],UR[i]) 
-          
-          #-----------> Declividade da curva de pressão do vapor
-          if np.isnan(Tmin[i]) == True or np.isnan(Tmax[i]) == True:
-              delta = Delta_medio(Tmedia[i]) 
-          else:
-              delta = Delta(Tmin[i],Tmax[i]) 
-          
-          #-----------> Pressão atmosférica
-          pressao_atm = Pressao_atm(Alt) 
-          
-          #------------> Constante psicrométrica
-          gamma = psicrometrica(pressao_atm)
-          
-          #------------> Declinação solar
-          declinacao_sol = Declinacao_sol(J[i]) 
-          
-          #------------> Ângulo horário pôr-do-sol
-          omega = Omega(Lat, declinacao_sol) 
-          
-          #------------> Inverso da distância relativa da terra-sol
-          dr = Dr(J[i]) 
-          
-          #------------> Radiação extraterrestre para períodos diários
-          ra = Ra(Lat, declinacao_sol, omega, dr, Gsc) 
-          
-          #-----------> Duração máxima de insolação no dia
-          N = N_insolacao(omega)
-          
-          #------------> Radiação solar              
-          if Radiacao == None and Insolacao == None:
-              rs = Rs_T(ra, Tmax[i], Tmin[i]) # Calcula com temperaturas
-          elif Radiacao == None:
-              rs = Rs_I(N, Insolacao[i], ra)  # Calcula com Insolação
-          else:
-              if np.isnan(Radiacao[i]) == True:
-                  rs = Radiacao[i]  # Calcula com Radiação
-              if np.isnan(Radiacao[i]) == False:
-                  rs = Rs_I(N, Insolacao[i], ra[i])  # Calcula com Insolação
-              else:
-                  rs = Rs_T(ra[i], Tmax[i], Tmin[i]) # Calcula com temperaturas
+    if isinstance(J, str):
+        data = J[6:10] + '-' + J[3:5] + '-' + J[0:2]
+        adate = datetime.strptime(data,"%Y-%m-%d")
+        J = adate.timetuple().tm_yday
+        serie_eto = _gera_serie_vetor(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia, Insolacao, Radiacao)
+        return float(serie_eto[0])
+    return _gera_serie_vetor(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia, Insolacao, Radiacao)
+
+@Instrumentacao.medido()
+def gera_serie_estacoes(estacoes, Tmin, Tmax, UR, U2, J, Gsc, Sigma, G, Tmedia=None, Insolacao=None, Radiacao=None):
+    """
+    Gera a série de ETo de várias estações de uma só vez: Equação 6 (FAO 56)
+    :parâmetro estacoes: dataframe (ou lista de dicionários) com as colunas LATITUDE [graus] e ALTITUDE [m], uma linha por estação.
+    :parâmetro Tmin, Tmax, UR, U2: matrizes (estação x dia) com os dados climáticos, na mesma ordem de estacoes.
+    :parâmetro J: dia do ano, vetor (dia) comum a todas as estações ou matriz (estação x dia).
+    :parâmetro Gsc: Constante Solar em MJ K-4 m-2 dia-1
+    :parâmetro Sigma: Constante Stefan Boltzmann em MJ K-4 m-2 dia-1
+    :parâmetro G: Fluxo de calor do solo para o período de 1 dia ou 10 dias
+    :parâmetro Tmedia, Insolacao, Radiacao: matrizes (estação x dia) opcionais, como em gera_serie().
+    :return: dataframe (estação x dia) com a ETo [mm day-1]. O índice é o de estacoes e as colunas
+             as de Tmin, quando Tmin for um dataframe.
+    """
+    estacoes = pd.DataFrame(estacoes)
+    #Converte a latitude de graus para radianos
+    Lat = math.pi/180 * estacoes['LATITUDE'].to_numpy(dtype=float).reshape(-1, 1)
+    Alt = estacoes['ALTITUDE'].to_numpy(dtype=float).reshape(-1, 1)
+    colunas = Tmin.columns if isinstance(Tmin, pd.DataFrame) else None
+    serie_eto = _gera_serie_vetor(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia, Insolacao, Radiacao)
+    return pd.DataFrame(serie_eto, index=estacoes.index, columns=colunas)
+
+def gera_serie_arquivo(caminho, Lat, Alt, Gsc, Sigma, G, colunas=COLUNAS_NASA_POWER, z=None, tamanho_bloco=100000,
+                       arquivo_saida=None, delimiter=',', limite_pendente=None):
+    """
+    Gera a série de ETo de um arquivo CSV lido em blocos, com memória limitada ao tamanho do bloco.
+    Cada bloco recebe os ajustes do módulo Ajuste (vento a 2m, vento faltante, interpolação das temperaturas e
+    dia do ano) e a ETo é calculada por gera_serie(). As linhas cujas temperaturas dependem de valores ainda não
+    lidos (falhas que continuam no bloco seguinte) são guardadas e processadas com o bloco seguinte, de modo que
+    o resultado é igual ao da base de dados inteira ajustada em memória. Para manter a memória limitada, uma falha de
+    temperatura com mais de limite_pendente linhas ainda sem valor posterior não é interpolada: as linhas são emitidas
+    com as temperaturas faltantes e ETo NaN.
+    :parâmetro caminho: caminho do arquivo CSV com os dados climáticos diários, em ordem cronológica.
+    :parâmetro Lat: Latitude em graus
+    :parâmetro Alt: Altitude em metros
+    :parâmetro Gsc: Constante Solar em MJ K-4 m-2 dia-1
+    :parâmetro Sigma: Constante Stefan Boltzmann em MJ K-4 m-2 dia-1
+    :parâmetro G: Fluxo de calor do solo para o período de 1 dia ou 10 dias
+    :parâmetro colunas: dicionário com o nome no arquivo de cada entrada (DATA, Tmin, Tmax, Tmedia, UR, U2, Insolacao e
+                        Radiacao). Entradas opcionais ausentes recebem None. Padrão: COLUNAS_NASA_POWER.
+    :parâmetro z: altura do anemômetro. Se None, o vento já está a 2m e não é convertido.
+    :parâmetro tamanho_bloco: número de linhas lidas por vez.
+    :parâmetro arquivo_saida: caminho de um CSV (DATA, ETO) onde os resultados são acrescentados à medida que são gerados.
+    :parâmetro delimiter: separador do arquivo CSV.
+    :parâmetro limite_pendente: número máximo de linhas guardadas à espera do fim de uma falha de temperatura.
+                                Padrão: tamanho_bloco.
+    :return: gerador de dataframes (DATA, ETO), um por bloco processado.
+    """
+    limite_pendente = tamanho_bloco if limite_pendente is None else limite_pendente
+    temperaturas = [colunas['Tmax'], colunas['Tmin']]
+    pendente, emitidas, cabecalho = None, 0, True
+    leitor = pd.read_csv(caminho, delimiter=delimiter, chunksize=tamanho_bloco)
+    for bloco in itertools.chain(leitor, [None]):
+        if bloco is None:
+            if pendente is None:
+                break
+            base, limite = pendente, pendente.shape[0]
+        else:
+            Instrumentacao.conta('Calcula_ETo.gera_serie_arquivo.linhas_lidas', bloco.shape[0])
+            base = bloco if pendente is None else pd.concat([pendente, bloco])
+            base = base.reset_index(drop=True)
+            #Linhas até o último valor válido de cada temperatura já têm a interpolação definida
+            limite = base.shape[0]
+            for coluna in temperaturas:
+                validos = np.flatnonzero(base[coluna].notna().to_numpy())
+                if validos.size:
+                    limite = min(limite, validos[-1] + 1)
+        #------------> Falha longa demais para ser guardada: as linhas seguintes são emitidas sem interpolação
+        sem_interpolacao = None
+        if bloco is not None and base.shape[0] - limite > limite_pendente:
+            sem_interpolacao, limite = limite, base.shape[0]
+        #------------> Ajustes do FAO 56 sobre a base; apenas as linhas definidas são processadas
+        Tmedia = base[colunas['Tmedia']].copy() if colunas.get('Tmedia') else pd.Series(np.nan, index=base.index)
+        Tmedia_original = Tmedia.copy()
+        Tmax, Tmin, Tmedia = Ajuste.interpola_Temperatura(base[colunas['Tmax']], base[colunas['Tmin']], Tmedia)
+        if sem_interpolacao is not None:
+            cauda = pd.Series(np.arange(base.shape[0]) >= sem_interpolacao, index=base.index)
+            Tmax = Tmax.mask(cauda, base[colunas['Tmax']])
+            Tmin = Tmin.mask(cauda, base[colunas['Tmin']])
+            Tmedia = Tmedia.mask(cauda, Tmedia_original.fillna((Tmax + Tmin) / 2))
+        saida = base.iloc[emitidas:limite].copy()
+        U2 = saida[colunas['U2']]
+        if z is not None:
+            U2 = Ajuste.conversao_U2(U2, z)
+        U2 = Ajuste.completa_U2(U2)
+        J = Ajuste.calcula_dia(saida[[colunas['DATA']]])['J']
+        opcional = lambda chave: saida[colunas[chave]] if colunas.get(chave) else None
+        eto = gera_serie(Tmin.iloc[emitidas:limite], Tmax.iloc[emitidas:limite], saida[colunas['UR']], U2, J,
+                         Lat, Alt, Gsc, Sigma, G, Tmedia.iloc[emitidas:limite], opcional('Insolacao'), opcional('Radiacao'))
+        resultado = pd.DataFrame({'DATA': saida[colunas['DATA']].to_numpy(), 'ETO': eto})
+        if arquivo_saida is not None and resultado.shape[0]:
+            resultado.to_csv(arquivo_saida, mode='w' if cabecalho else 'a', header=cabecalho, index=False)
+            cabecalho = False
+        if resultado.shape[0]:
+            yield resultado
+        if bloco is None:
+            break
+        if sem_interpolacao is not None:
+            pendente, emitidas = None, 0
+            continue
+        #------------> Guarda as linhas pendentes e, para cada temperatura, o último valor válido anterior a elas
+        inicio = limite
+        for coluna in temperaturas:
+            validos = np.flatnonzero(base[coluna].iloc[:limite].notna().to_numpy())
+            if validos.size:
+                inicio = min(inicio, validos[-1])
+        pendente, emitidas = base.iloc[inicio:], limite - inicio
+    
+def _geometria_solar(Lat, Alt, Gsc, J):
+    """
+    Consulta a tabela_solar() de uma ou mais estações para os dias do ano informados.
+    :parâmetro Lat: latitude [rad], escalar ou array (estação x 1).
+    :parâmetro Alt: altitude [m], escalar ou array (estação x 1).
+    :parâmetro Gsc: Constante Solar [MJ m-2 min-1]
+    :parâmetro J: dia do ano.
+    :return: radiação extraterrestre, duração máxima de insolação e radiação de céu claro. Dias do ano inválidos
+             (NaN, fora de 1 a 366 ou não inteiros) recebem NaN.
+    """
+    J = np.asarray(J, dtype=float)
+    with np.errstate(invalid='ignore'):
+        valido = np.isfinite(J) & (J >= 1) & (J <= 366) & (J == np.floor(J))
+    dia = np.where(valido, J, 1).astype(int) - 1
+    if np.ndim(Lat) == 0:
+        tabela = tabela_solar(float(Lat), float(Alt), float(Gsc))
+        ra, N, rso = tabela['ra'][dia], tabela['N'][dia], tabela['rso'][dia]
+    else:
+        ra, N, rso = tabelas_solares(Lat, Alt, Gsc)
+        estacao = np.arange(ra.shape[0]).reshape(-1, 1)
+        ra, N, rso = ra[estacao, dia], N[estacao, dia], rso[estacao, dia]
+    if valido.all():
+        return ra, N, rso
+    return np.where(valido, ra, np.nan), np.where(valido, N, np.nan), np.where(valido, rso, np.nan)
+
+def _gera_serie_vetor(Tmin, Tmax, UR, U2, J, Lat, Alt, Gsc, Sigma, G, Tmedia=None, Insolacao=None, Radiacao=None):
+    """
+    Calcula a ETo sobre vetores inteiros, usando máscaras para os dados faltantes.
+    Mesmos parâmetros de gera_serie(), com a latitude já em radianos. Latitude e altitude podem ser
+    arrays (estação x 1) para o cálculo de várias estações em matrizes (estação x dia).
+    :return: array numpy com a ETo [mm day-1].
+    """
+    Tmin = np.atleast_1d(np.asarray(Tmin, dtype=float))
+    Tmax = np.atleast_1d(np.asarray(Tmax, dtype=float))
+    UR = np.asarray(UR, dtype=float)
+    U2 = np.asarray(U2, dtype=float)
+    J = np.asarray(J)
+    if Tmedia is None:
+        Tmedia = np.full(np.broadcast(Tmin, Tmax).shape, np.nan)
+    else:
+        Tmedia = np.asarray(Tmedia, dtype=float)
 
-          #-----------> Radiação solar de céu claro
-          rso = Rso(Alt, ra)
-          
-          #------------> Radiação de onda curta líquida
-          rns = Rns(rs)
-          
-          #------------> Radiação de onda longa líquida
-          if np.isnan(Tmin[i]) == True or np.isnan(Tmax[i]) == True:
-              rnl = Rnl_medio(Tmedia[i], rs, rso, ea, Sigma) 
-          else:
-              rnl = Rnl(Tmin[i],Tmax[i], rs, rso, ea, Sigma) 
-          
-          #------------> Radiação líquida
-          rn = Rn(rns,rnl) 
-          
-          #------------> Evapotranspiração
-          if np.isnan(Tmin[i]) == True or np.isnan(Tmax[i]) == True:
-              serie_eto.append(fao56_penman_monteith_medio(rn, Tmedia[i], U2[i], es, ea, delta, gamma, G)) 
-          else:
-              serie_eto.append(fao56_penman_monteith_T(rn, Tmin[i], Tmax[i], U2[i], es, ea, delta, gamma, G)) 
-    except:
-          data = J[6:10] + '-' + J[3:5] + '-' + J[0:2]
-          adate = datetime.strptime(data,"%Y-%m-%d")
-          J = adate.timetuple().tm_yday
-          serie_eto = 0
-          if np.isnan(Tmin) == True or np.isnan(Tmax) == True:
-              es = Es(Tmedia) 
-          else:
-              es = Es_medio(Tmin,Tmax) 
-          
-          #-----------> Pressão do vapor atual
-          ea = Ea(Tmin,Tmax,UR) 
-          
-          #-----------> Declividade da curva de pressão do vapor
-          if np.isnan(Tmin) == True or np.isnan(Tmax) == True:
-              delta = Delta_medio(Tmedia) 
-          else:
-              delta = Delta(Tmin,Tmax) 
-          
-          #-----------> Pressão atmosférica
-          pressao_atm = Pressao_atm(Alt) 
-          
-          #------------> Constante psicrométrica
-          gamma = psicrometrica(pressao_atm)
-          
-          #------------> Declinação solar
-          declinacao_sol = Declinacao_sol(J) 
-          
-          #------------> Ângulo horário pôr-do-sol
-          omega = Omega(Lat, declinacao_sol) 
-          
-          #------------> Inverso da distância relativa da terra-sol
-          dr = Dr(J) 
-          
-          #------------> Radiação extraterrestre para períodos diários
-          ra = Ra(Lat, declinacao_sol, omega, dr, Gsc) 
-          
-          #-----------> Duração máxima de insolação no dia
-          N = N_insolacao(omega)
-          
-          #------------> Radiação solar
-          if Radiacao == None and Insolacao == None:
-              rs = Rs_T(ra, Tmax, Tmin) # Calcula com temperaturas
-          elif Radiacao == None:
-              rs = Rs_I(N, Insolacao, ra)  # Calcula com Insolação
-          else:
-              if np.isnan(Radiacao) == True:
-                  rs = Radiacao  # Calcula com Radiação
-              if np.isnan(Radiacao) == False:
-                  rs = Rs_I(N, Insolacao, ra)  # Calcula com Insolação
-              else:
-                  rs = Rs_T(ra, Tmax, Tmin) # Calcula com temperaturas
-          
+    #-----------> Máscara dos dias sem Tmin ou Tmax: usa-se a Tmedia
+    sem_T = np.isnan(Tmin) | np.isnan(Tmax)
+    Instrumentacao.conta('Calcula_ETo.dias', sem_T.size)
 
-          #-----------> Radiação solar de céu claro
-          rso = Rso(Alt, ra)
-          
-          #------------> Radiação de onda curta líquida
-          rns = Rns(rs)
-          
-          #------------> Radiação de onda longa líquida
-          if np.isnan(Tmin) == True or np.isnan(Tmax) == True:
-              rnl = Rnl_medio(Tmedia, rs, rso, ea, Sigma) 
-          else:
-              rnl = Rnl(Tmin,Tmax, rs, rso, ea, Sigma) 
-          
-          #------------> Radiação líquida
-          rn = Rn(rns,rnl) 
-          
-          #------------> Evapotranspiração
-          if np.isnan(Tmin) == True or np.isnan(Tmax) == True:
-              serie_eto = fao56_penman_monteith_medio(rn, Tmedia, U2, es, ea, delta, gamma, G)
-          else:
-              serie_eto = fao56_penman_monteith_T(rn, Tmin, Tmax, U2, es, ea, delta, gamma, G)
-          return serie_eto
+    with np.errstate(invalid='ignore', divide='ignore'):
+      #------------> Pressão do vapor de saturação
+      es = np.where(sem_T, Es(Tmedia), Es_medio(Tmin,Tmax))
+      
+      #-----------> Pressão do vapor atual
+      ea = Ea(Tmin,Tmax,UR)
+      
+      #-----------> Declividade da curva de pressão do vapor
+      delta = np.where(sem_T, Delta_medio(Tmedia), Delta(Tmin,Tmax))
+      
+      #-----------> Pressão atmosférica e constante psicrométrica (constantes para a estação)
+      gamma = psicrometrica(Pressao_atm(Alt))
+      
+      #------------> Radiação extraterrestre, duração máxima de insolação e radiação de céu claro
+      ra, N, rso = _geometria_solar(Lat, Alt, Gsc, J)
+      
+      #------------> Radiação solar: medida, senão pela insolação, senão pelas temperaturas
+      rs = Rs_T(ra, Tmax, Tmin)
+      if Insolacao is not None:
+          Insolacao = np.asarray(Insolacao, dtype=float)
+          rs = np.where(np.isnan(Insolacao), rs, Rs_I(N, Insolacao, ra))
+      if Radiacao is not None:
+          Radiacao = np.asarray(Radiacao, dtype=float)
+          rs = np.where(np.isnan(Radiacao), rs, Radiacao)
+      
+      #------------> Radiação de onda curta líquida
+      rns = Rns(rs)
+      
+      #------------> Radiação de onda longa líquida
+      rnl = np.where(sem_T, Rnl_medio(Tmedia, rs, rso, ea, Sigma), Rnl(Tmin,Tmax, rs, rso, ea, Sigma))
+      
+      #------------> Radiação líquida
+      rn = Rn(rns,rnl)
+      
+      #------------> Evapotranspiração
+      serie_eto = np.where(sem_T,
+                           fao56_penman_monteith_medio(rn, Tmedia, U2, es, ea, delta, gamma, G),
+                           fao56_penman_monteith_T(rn, Tmin, Tmax, U2, es, ea, delta, gamma, G))
     return serie_eto
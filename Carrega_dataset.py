@@ -0,0 +1,208 @@
+"""
+Leitura das bases de dados climáticas (CSV) com cache binário por coluna.
+Na primeira leitura cada CSV é convertido em um arquivo .npy por coluna, com as datas já convertidas e a coluna J
+(dia do ano) calculada. As leituras seguintes abrem os arquivos .npy mapeados em memória, sem interpretar o texto,
+enquanto o hash (sha256) do arquivo de origem não mudar.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import Instrumentacao
+
+#Versão do formato do cache; caches de versões diferentes são refeitos
+VERSAO_CACHE = 2
+
+#Nome da pasta de cache, criada ao lado do arquivo de origem
+PASTA_CACHE = '.cache'
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+  """
+  Calcula o sha256 do conteúdo de um arquivo.
+  :parâmetro caminho: caminho do arquivo.
+  :parâmetro tamanho_bloco: número de bytes lidos por vez.
+  :return: hash em hexadecimal.
+  """
+  h = hashlib.sha256()
+  with open(caminho, 'rb') as arquivo:
+    for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+      h.update(bloco)
+  return h.hexdigest()
+
+def _separador(caminho):
+  """
+  Identifica o separador do CSV pelo cabeçalho (';' nas bases do INMET, ',' nas demais).
+  :parâmetro caminho: caminho do arquivo CSV.
+  :return: separador.
+  """
+  with open(caminho, 'r') as arquivo:
+    cabecalho = arquivo.readline()
+  return ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+
+def _pasta_cache(caminho, pasta_cache):
+  """
+  Pasta onde fica o cache de um arquivo.
+  :parâmetro caminho: caminho do arquivo CSV.
+  :parâmetro pasta_cache: pasta raiz do cache. Se None, PASTA_CACHE ao lado do arquivo.
+  :return: caminho da pasta do cache do arquivo.
+  """
+  if pasta_cache is None:
+    pasta_cache = os.path.join(os.path.dirname(os.path.abspath(caminho)), PASTA_CACHE)
+  return os.path.join(pasta_cache, os.path.splitext(os.path.basename(caminho))[0])
+
+def _pasta_nova(pasta):
+  """
+  Cria uma pasta vazia de nome único ao lado da pasta do cache, com a permissão padrão do processo.
+  :parâmetro pasta: pasta do cache do arquivo.
+  :return: caminho da pasta criada.
+  """
+  nova = '%s.%s' % (pasta, uuid.uuid4().hex)
+  os.mkdir(nova)
+  return nova
+
+def _le_csv(caminho, delimiter=None, coluna_data='DATA'):
+  """
+  Lê o CSV, converte as datas e calcula a coluna J (dia do ano) se não existir.
+  :parâmetro caminho: caminho do arquivo CSV.
+  :parâmetro delimiter: separador do CSV. Se None, identificado pelo cabeçalho.
+  :parâmetro coluna_data: nome da coluna de datas no formato 'YYYY-MM-DD'.
+  :return: dataframe lido do CSV.
+  """
+  dataset = pd.read_csv(caminho, delimiter=delimiter or _separador(caminho))
+  if coluna_data in dataset.columns:
+    dataset[coluna_data] = pd.to_datetime(dataset[coluna_data], format='%Y-%m-%d')
+    if 'J' not in dataset.columns:
+      dataset['J'] = dataset[coluna_data].dt.dayofyear.astype(np.int64)
+  return dataset
+
+def _le_meta(pasta):
+  """
+  Lê a descrição do cache.
+  :parâmetro pasta: pasta do cache do arquivo.
+  :return: dicionário da descrição ou None se o cache não existir.
+  """
+  try:
+    with open(os.path.join(pasta, 'meta.json'), 'r') as arquivo:
+      return json.load(arquivo)
+  except (OSError, ValueError):
+    return None
+
+@Instrumentacao.medido()
+def converte_csv(caminho, pasta_cache=None, delimiter=None, coluna_data='DATA'):
+  """
+  Converte um CSV em um arquivo .npy por coluna e grava a descrição (meta.json) com o hash da origem.
+  A coluna de datas é gravada como datetime64[ns] e a coluna J (dia do ano) é calculada se não existir.
+  :parâmetro caminho: caminho do arquivo CSV.
+  :parâmetro pasta_cache: pasta raiz do cache. Se None, PASTA_CACHE ao lado do arquivo.
+  :parâmetro delimiter: separador do CSV. Se None, identificado pelo cabeçalho.
+  :parâmetro coluna_data: nome da coluna de datas no formato 'YYYY-MM-DD'.
+  :return: dataframe lido do CSV, com as datas convertidas e a coluna J.
+  """
+  dataset = _le_csv(caminho, delimiter, coluna_data)
+  _grava_cache(dataset, _pasta_cache(caminho, pasta_cache), hash_arquivo(caminho))
+  return dataset
+
+def _grava_cache(dataset, pasta, origem):
+  """
+  Grava um arquivo .npy por coluna do dataframe e a descrição (meta.json) com o hash da origem.
+  :parâmetro dataset: dataframe lido do CSV.
+  :parâmetro pasta: pasta do cache do arquivo.
+  :parâmetro origem: sha256 do arquivo de origem.
+  """
+  os.makedirs(os.path.dirname(pasta), exist_ok=True)
+  #------------> Grava em uma pasta temporária e troca de uma vez, para não deixar cache incompleto
+  temporaria = _pasta_nova(pasta)
+  colunas = []
+  for i, nome in enumerate(dataset.columns):
+    valores = dataset[nome].to_numpy()
+    ausentes = None
+    if valores.dtype == object:
+      #Texto: os valores ausentes (NaN) são gravados em uma máscara, para não virarem o texto 'nan'
+      mascara = pd.isna(valores)
+      valores = np.where(mascara, '', valores).astype(str)
+      if mascara.any():
+        ausentes = 'ausentes_%03d.npy' % i
+        np.save(os.path.join(temporaria, ausentes), mascara, allow_pickle=False)
+    arquivo = 'coluna_%03d.npy' % i
+    np.save(os.path.join(temporaria, arquivo), valores, allow_pickle=False)
+    colunas.append({'nome': nome, 'arquivo': arquivo, 'dtype': valores.dtype.str, 'ausentes': ausentes})
+  meta = {'versao': VERSAO_CACHE, 'sha256': origem, 'linhas': int(dataset.shape[0]), 'colunas': colunas}
+  with open(os.path.join(temporaria, 'meta.json'), 'w') as arquivo:
+    json.dump(meta, arquivo, ensure_ascii=False, indent=1)
+  #------------> O cache antigo é movido para fora antes da troca (sem apagar arquivos de uma pasta em uso)
+  descarte = _pasta_nova(pasta)
+  try:
+    os.replace(pasta, descarte)
+  except OSError:
+    pass
+  try:
+    os.replace(temporaria, pasta)
+  except OSError:
+    #Outro processo gravou o cache do mesmo arquivo ao mesmo tempo: o cache dele é mantido
+    shutil.rmtree(temporaria, ignore_errors=True)
+  shutil.rmtree(descarte, ignore_errors=True)
+
+def _le_coluna(pasta, coluna, modo):
+  """
+  Lê uma coluna do cache, restaurando os valores ausentes das colunas de texto.
+  :parâmetro pasta: pasta do cache do arquivo.
+  :parâmetro coluna: descrição da coluna em meta.json.
+  :parâmetro modo: mmap_mode de np.load.
+  :return: array com os valores da coluna.
+  """
+  #np.asarray: vista ndarray comum do arquivo mapeado (sem cópia), em vez da subclasse np.memmap
+  valores = np.asarray(np.load(os.path.join(pasta, coluna['arquivo']), mmap_mode=modo, allow_pickle=False))
+  if coluna.get('ausentes'):
+    valores = valores.astype(object)
+    valores[np.load(os.path.join(pasta, coluna['ausentes']), allow_pickle=False)] = np.nan
+  return valores
+
+@Instrumentacao.medido()
+def carrega_dataset(caminho, pasta_cache=None, delimiter=None, coluna_data='DATA', mmap=True):
+  """
+  Lê uma base de dados climática usando o cache binário, refeito apenas quando o arquivo de origem muda.
+  :parâmetro caminho: caminho do arquivo CSV.
+  :parâmetro pasta_cache: pasta raiz do cache. Se None, PASTA_CACHE ao lado do arquivo.
+  :parâmetro delimiter: separador do CSV. Se None, identificado pelo cabeçalho.
+  :parâmetro coluna_data: nome da coluna de datas no formato 'YYYY-MM-DD'.
+  :parâmetro mmap: se True, os arquivos .npy são abertos mapeados em memória (cópia na escrita) e as colunas do
+                   dataframe usam os arrays mapeados sem copiá-los (pandas >= 2; versões anteriores agrupam as
+                   colunas de mesmo tipo em uma cópia).
+  :return: dataframe com as colunas do CSV, as datas convertidas e a coluna J.
+  """
+  pasta = _pasta_cache(caminho, pasta_cache)
+  meta = _le_meta(pasta)
+  origem = hash_arquivo(caminho)
+  if meta is not None and meta.get('versao') == VERSAO_CACHE and meta.get('sha256') == origem:
+    modo = 'c' if mmap else None
+    try:
+      colunas = {c['nome']: _le_coluna(pasta, c, modo) for c in meta['colunas']}
+      Instrumentacao.conta('Carrega_dataset.cache.acertos')
+      return pd.DataFrame(colunas, copy=False)
+    except (OSError, ValueError):
+      #Cache trocado por outro processo durante a leitura: lido de novo a partir do CSV
+      pass
+  Instrumentacao.conta('Carrega_dataset.cache.falhas')
+  dataset = _le_csv(caminho, delimiter, coluna_data)
+  try:
+    _grava_cache(dataset, pasta, origem)
+  except OSError:
+    #Pasta sem permissão de escrita (ex.: instalação somente leitura): os dados são usados sem cache
+    Instrumentacao.conta('Carrega_dataset.cache.erros_gravacao')
+  return dataset
+
+def carrega_pasta(pasta='Datasets', pasta_cache=None, coluna_data='DATA', mmap=True):
+  """
+  Lê todas as bases de dados CSV de uma pasta usando o cache binário.
+  :parâmetro pasta: pasta com os arquivos CSV.
+  :parâmetro pasta_cache: pasta raiz do cache. Se None, PASTA_CACHE dentro da pasta.
+  :parâmetro coluna_data: nome da coluna de datas no formato 'YYYY-MM-DD'.
+  :parâmetro mmap: se True, os arquivos .npy são abertos mapeados em memória.
+  :return: dicionário nome do arquivo (sem extensão) -> dataframe.
+  """
+  return {os.path.splitext(nome)[0]: carrega_dataset(os.path.join(pasta, nome), pasta_cache, None, coluna_data, mmap)
+          for nome in sorted(os.listdir(pasta)) if nome.lower().endswith('.csv')}
@@ -0,0 +1,175 @@
+"""
+Instrumentação opcional: tempo gasto por etapa e contadores (linhas processadas, instruções SQL, requisições HTTP,
+acertos de cache), para saber onde vai o tempo de uma execução.
+Desativada por padrão; enquanto desativada, cronometro() retorna um objeto vazio compartilhado, as funções marcadas com
+medido() são chamadas diretamente e conta() apenas testa a variável ATIVO.
+Uso:
+  Instrumentacao.ativa()
+  ...execução...
+  print(Instrumentacao.relatorio_dataframe())
+  Instrumentacao.exporta('relatorio.json')
+"""
+
+import sys
+import json
+import time
+import functools
+import threading
+import contextlib
+
+#Instrumentação ligada ou desligada (ver ativa() e desativa())
+ATIVO = False
+
+#Etapa -> [chamadas, segundos] e contador -> valor
+_tempos = {}
+_contadores = {}
+_trava = threading.Lock()
+
+def ativa(reiniciar=True):
+  """
+  Liga a instrumentação.
+  :parâmetro reiniciar: se True, descarta os tempos e contadores registrados antes.
+  """
+  global ATIVO
+  if reiniciar:
+    reinicia()
+  ATIVO = True
+
+def desativa():
+  """
+  Desliga a instrumentação, mantendo os tempos e contadores registrados.
+  """
+  global ATIVO
+  ATIVO = False
+
+def reinicia():
+  """
+  Descarta os tempos e contadores registrados.
+  """
+  with _trava:
+    _tempos.clear()
+    _contadores.clear()
+
+@contextlib.contextmanager
+def ativado(reiniciar=True):
+  """
+  Liga a instrumentação dentro de um bloco with e restaura o estado anterior na saída.
+  :parâmetro reiniciar: se True, descarta os tempos e contadores registrados antes.
+  :return: o próprio módulo, para consultar o relatório dentro ou depois do bloco.
+  """
+  global ATIVO
+  anterior = ATIVO
+  ativa(reiniciar)
+  try:
+    yield sys.modules[__name__]
+  finally:
+    ATIVO = anterior
+
+def registra(etapa, segundos):
+  """
+  Acrescenta uma chamada e o tempo gasto a uma etapa.
+  :parâmetro etapa: nome da etapa.
+  :parâmetro segundos: tempo gasto [s].
+  """
+  with _trava:
+    total = _tempos.setdefault(etapa, [0, 0.0])
+    total[0] += 1
+    total[1] += segundos
+
+def conta(contador, quantidade=1):
+  """
+  Incrementa um contador (sem efeito com a instrumentação desligada).
+  :parâmetro contador: nome do contador.
+  :parâmetro quantidade: valor somado ao contador.
+  """
+  if ATIVO:
+    with _trava:
+      _contadores[contador] = _contadores.get(contador, 0) + quantidade
+
+class _Cronometro:
+  """
+  Mede o tempo de um bloco with e registra na etapa.
+  :parâmetro etapa: nome da etapa.
+  """
+  __slots__ = ('etapa', 'inicio')
+
+  def __init__(self, etapa):
+    self.etapa = etapa
+
+  def __enter__(self):
+    self.inicio = time.perf_counter()
+    return self
+
+  def __exit__(self, tipo, valor, traceback):
+    registra(self.etapa, time.perf_counter() - self.inicio)
+
+class _CronometroVazio:
+  """
+  Cronômetro usado com a instrumentação desligada: não mede nada.
+  """
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, tipo, valor, traceback):
+    return None
+
+_VAZIO = _CronometroVazio()
+
+def cronometro(etapa):
+  """
+  Cronômetro de um bloco with.
+  :parâmetro etapa: nome da etapa.
+  :return: gerenciador de contexto que registra o tempo do bloco na etapa.
+  """
+  return _Cronometro(etapa) if ATIVO else _VAZIO
+
+def medido(etapa=None):
+  """
+  Decorador que registra o tempo de cada chamada da função.
+  :parâmetro etapa: nome da etapa. Padrão: módulo.nome da função.
+  :return: decorador.
+  """
+  def decorador(funcao):
+    nome = etapa or '{}.{}'.format(funcao.__module__, funcao.__qualname__)
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+      if not ATIVO:
+        return funcao(*args, **kwargs)
+      inicio = time.perf_counter()
+      try:
+        return funcao(*args, **kwargs)
+      finally:
+        registra(nome, time.perf_counter() - inicio)
+    return medida
+  return decorador
+
+def relatorio():
+  """
+  Tempos e contadores registrados.
+  :return: dicionário com etapas (etapa -> chamadas, segundos e segundos por chamada) e contadores.
+  """
+  with _trava:
+    etapas = {etapa: {'chamadas': n, 'segundos': s, 'segundos_por_chamada': s / n} for etapa, (n, s) in _tempos.items()}
+    return {'etapas': etapas, 'contadores': dict(_contadores)}
+
+def relatorio_dataframe():
+  """
+  Tempos registrados como dataframe, da etapa mais demorada para a menos demorada.
+  :return: dataframe indexado pela etapa (CHAMADAS, SEGUNDOS, SEGUNDOS_POR_CHAMADA).
+  """
+  import pandas as pd
+  etapas = relatorio()['etapas']
+  df = pd.DataFrame.from_dict(etapas, orient='index', columns=['chamadas', 'segundos', 'segundos_por_chamada'])
+  df.columns = ['CHAMADAS', 'SEGUNDOS', 'SEGUNDOS_POR_CHAMADA']
+  df.index.name = 'ETAPA'
+  return df.sort_values('SEGUNDOS', ascending=False)
+
+def exporta(caminho):
+  """
+  Grava o relatório em JSON.
+  :parâmetro caminho: caminho do arquivo JSON.
+  """
+  with open(caminho, 'w') as arquivo:
+    json.dump(relatorio(), arquivo, indent=1, ensure_ascii=False)
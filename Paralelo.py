@@ -0,0 +1,110 @@
+"""
+Execução paralela de experimentos de balanço hídrico.
+Os cenários (locais x culturas x datas de plantio x parâmetros de solo) são independentes entre si e são
+distribuídos entre processos. As séries climáticas de cada local são enviadas aos processos uma única vez,
+por memória compartilhada, e os resultados são coletados na mesma ordem dos cenários.
+"""
+
+import os
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import Balanco_Hidrico
+
+#Séries climáticas reconstruídas em cada processo a partir da memória compartilhada
+_locais = {}
+_memorias = []
+
+def _compartilha_locais(locais):
+  """
+  Copia as séries de ETo e precipitação de cada local para blocos de memória compartilhada.
+  :parâmetro locais: dicionário nome do local -> dicionário com ETO e P (dataframes, Coluna 0 - Data, Coluna 1 - Valor).
+  :return: lista com os blocos criados e descrição dos blocos (nomes dos blocos de datas e de valores e número de dias)
+           por local e série.
+  """
+  memorias, descricao = [], {}
+  for nome, series in locais.items():
+    descricao[nome] = {}
+    for chave in ('ETO', 'P'):
+      serie = series[chave]
+      #Datas em um bloco int64 (nanossegundos, sem arredondamento) e valores em um bloco float64
+      datas = pd.to_datetime(serie.iloc[:,0]).values.astype('datetime64[ns]').view(np.int64)
+      valores = serie.iloc[:,1].to_numpy(dtype=float)
+      blocos = []
+      for array in (datas, valores):
+        memoria = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memoria.buf)[:] = array
+        memorias.append(memoria)
+        blocos.append(memoria.name)
+      descricao[nome][chave] = (blocos[0], blocos[1], serie.shape[0], list(serie.columns))
+  return memorias, descricao
+
+def _inicia_processo(descricao):
+  """
+  Inicialização de cada processo: acessa os blocos de memória compartilhada e monta os dataframes dos locais.
+  :parâmetro descricao: descrição dos blocos, como retornada por _compartilha_locais().
+  """
+  for nome, series in descricao.items():
+    _locais[nome] = {}
+    for chave, (bloco_datas, bloco_valores, n, colunas) in series.items():
+      memoria_datas = shared_memory.SharedMemory(name=bloco_datas)
+      memoria_valores = shared_memory.SharedMemory(name=bloco_valores)
+      _memorias.extend((memoria_datas, memoria_valores))
+      datas = np.ndarray((n,), dtype=np.int64, buffer=memoria_datas.buf).view('datetime64[ns]')
+      valores = np.ndarray((n,), dtype=float, buffer=memoria_valores.buf)
+      _locais[nome][chave] = pd.DataFrame({colunas[0]: pd.to_datetime(datas), colunas[1]: valores})
+
+def _executa_cenario(tarefa):
+  """
+  Executa um cenário em um processo do pool.
+  :parâmetro tarefa: tupla (índice do cenário, dicionário com os argumentos de balanco()).
+  :return: índice do cenário, resultado de balanco(), pid do processo e tempo gasto [s].
+  """
+  indice, cenario = tarefa
+  inicio = time.perf_counter()
+  serie = _locais[cenario['local']]
+  resultado = Balanco_Hidrico.balanco(cenario['local'], cenario['cultura'], cenario['theta_fc'], cenario['theta_wp'],
+                                      cenario['p'], serie['P'], serie['ETO'], cenario['periodo'], cenario['z_etapas'],
+                                      cenario['forma_z'], cenario['kc_etapas'], cenario['forma_kc'], cenario['data_in'], None)
+  return indice, resultado, os.getpid(), time.perf_counter() - inicio
+
+def executa_paralelo(cenarios, locais, database_path=None, processos=None, lote=16):
+  """
+  Executa balanco() para uma lista de cenários em um pool de processos.
+  :parâmetro cenarios: lista de dicionários com os argumentos de balanco(): local, cultura, theta_fc, theta_wp, p, periodo,
+                       z_etapas, forma_z, kc_etapas, forma_kc e data_in. O local indica a chave em locais.
+  :parâmetro locais: dicionário nome do local -> dicionário com ETO e P (dataframes no formato de balanco()).
+  :parâmetro database_path: caminho para o banco de dados ou um GravadorResultados. Se informado, os resultados são
+                            gravados em lote, na ordem dos cenários.
+  :parâmetro processos: número de processos do pool. Padrão: número de CPUs.
+  :parâmetro lote: número de cenários enviados por vez a cada processo.
+  :return: lista com os resultados de balanco() na ordem dos cenários e dataframe com o desempenho de cada processo
+           (CENARIOS, SEGUNDOS e CENARIOS_POR_SEGUNDO, indexado pelo pid).
+  """
+  processos = processos or os.cpu_count()
+  memorias, descricao = _compartilha_locais(locais)
+  resultados = [None] * len(cenarios)
+  desempenho = {}
+  gravador = database_path
+  if database_path is not None and not isinstance(database_path, Balanco_Hidrico.GravadorResultados):
+    gravador = Balanco_Hidrico.GravadorResultados(database_path)
+  try:
+    with multiprocessing.Pool(processos, initializer=_inicia_processo, initargs=(descricao,)) as pool:
+      for indice, resultado, pid, segundos in pool.imap(_executa_cenario, enumerate(cenarios), chunksize=lote):
+        resultados[indice] = resultado
+        n, total = desempenho.get(pid, (0, 0.0))
+        desempenho[pid] = (n + 1, total + segundos)
+        if gravador is not None:
+          Balanco_Hidrico.grava_resultado(resultado, gravador)
+  finally:
+    if gravador is not None and gravador is not database_path:
+      gravador.fecha()
+    for memoria in memorias:
+      memoria.close()
+      memoria.unlink()
+  desempenho = pd.DataFrame.from_dict(desempenho, orient='index', columns=['CENARIOS', 'SEGUNDOS'])
+  desempenho.index.name = 'PID'
+  desempenho['CENARIOS_POR_SEGUNDO'] = desempenho['CENARIOS'] / desempenho['SEGUNDOS']
+  return resultados, desempenho
@@ -3,55 +3,221 @@ Upload da base de dados.
 Os dados são originais da plataforma Google Engine: "UCSB-CHG/CHIRPS/DAILY" e NASA POWER.
 """
 
-import ee
+import os
 import json
-from ipygee import*
+import hashlib
 import pandas as pd
 import numpy as np
+import Instrumentacao
 
-def get_google_engine(latitude, longitude, start, end):
-  ee_coord = ee.Geometry.Point([longitude,latitude])
-  ref_coll = ee.ImageCollection("UCSB-CHG/CHIRPS/DAILY")\
-    .select('precipitation')\
-    .filterBounds(ee_coord)\
-    .filterDate(start, end)
-  count = ref_coll.size()
-  num_image = count.getInfo()
-  coll_list = ref_coll.toList(num_image)
-  values_output = []
-  for i in range(0,num_image):
-      img_temp = ee.Image(coll_list.get(i))
-      dict = img_temp.reduceRegion(reducer = ee.Reducer.first(), geometry = ee_coord, scale = 2400)
-      value_pixel = list(dict.getInfo().values())[0]  
-      dates = ref_coll.aggregate_array('system:time_start').map(lambda d: ee.Date(d).format('YYYY-MM-dd')).sort()    
-      values_output.append((dates, value_pixel))
-  df_cols = ['DATA', 'P']
-  df_ge = pd.DataFrame(values_output, columns = df_cols)
-  df_ge = df_ge.drop(['DATA'], axis=1)
-  return df_ge
-
-
-def get_nasa_power(latitude, longitude, start, end):
-  import os, json, requests
-
-  base_url = r"https://power.larc.nasa.gov/api/temporal/daily/point?parameters=T2M,T2M_MAX,T2M_MIN,RH2M,WS2M,ALLSKY_SFC_SW_DWN,TOA_SW_DWN&community=RE&longitude={longitude}&latitude={latitude}&start={start}&end={end}&format=JSON"
-  api_request_url = base_url.format(longitude=longitude, latitude=latitude, start=start, end=end)
-
-  response = requests.get(url=api_request_url, verify=True, timeout=30.00)
-  content = json.loads(response.content.decode('utf-8'))
+#Número de dias de cada janela de datas enviada ao Google Engine em uma única requisição
+JANELA_GOOGLE_ENGINE = 3650
+
+#Número máximo de valores (pontos x dias) por requisição ao Google Engine, abaixo do limite de 1048576 do getRegion()
+LIMITE_VALORES_GOOGLE_ENGINE = 1000000
+
+
+def _janelas_datas(start, end, dias):
+  """
+  Divide o intervalo [start, end) em janelas de datas.
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :parâmetro dias: número máximo de dias por janela.
+  :return: lista de tuplas (início, final) no formato 'YYYY-MM-dd'.
+  """
+  inicio, fim = pd.Timestamp(start), pd.Timestamp(end)
+  janelas = []
+  while inicio < fim:
+    proximo = min(inicio + pd.Timedelta(days=dias), fim)
+    janelas.append((str(inicio.date()), str(proximo.date())))
+    inicio = proximo
+  return janelas
+
+
+@Instrumentacao.medido()
+def get_google_engine_pontos(pontos, start, end, janela_dias=JANELA_GOOGLE_ENGINE, cliente=None,
+                             limite_valores=LIMITE_VALORES_GOOGLE_ENGINE):
+  """
+  Precipitação diária do CHIRPS para vários pontos, extraída em lote.
+  Para cada janela de datas e lote de pontos, os valores e as datas são obtidos com getRegion() em uma única
+  requisição (getInfo), em vez de uma requisição por imagem. Os pontos são divididos em lotes (e a janela reduzida,
+  se preciso) para que cada requisição tenha no máximo limite_valores valores (pontos x dias).
+  :parâmetro pontos: lista de tuplas (latitude, longitude).
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :parâmetro janela_dias: número máximo de dias por requisição.
+  :parâmetro cliente: módulo ou objeto com a interface do Earth Engine (Geometry, ImageCollection e List). Padrão: ee.
+  :parâmetro limite_valores: número máximo de valores (pontos x dias) por requisição.
+  :return: lista de dataframes (DATA, P), um por ponto, com todos os dias do intervalo (NaN nos dias sem imagem).
+  """
+  if cliente is None:
+    import ee as cliente
+  janela_dias = max(1, min(janela_dias, limite_valores))
+  geometrias = [cliente.Geometry.Point([longitude, latitude]) for latitude, longitude in pontos]
+  colecao = cliente.ImageCollection("UCSB-CHG/CHIRPS/DAILY").select('precipitation')
+  cabecalho, linhas = None, [[] for _ in pontos]
+  for inicio, fim in _janelas_datas(start, end, janela_dias):
+    janela = colecao.filterDate(inicio, fim)
+    por_lote = max(1, limite_valores // (pd.Timestamp(fim) - pd.Timestamp(inicio)).days)
+    for primeiro in range(0, len(geometrias), por_lote):
+      lote = geometrias[primeiro:primeiro + por_lote]
+      regioes = cliente.List([janela.getRegion(geometria, 2400) for geometria in lote]).getInfo()
+      Instrumentacao.conta('Upload_dataset.ee.requisicoes')
+      for i, regiao in enumerate(regioes, primeiro):
+        cabecalho = regiao[0]
+        linhas[i].extend(regiao[1:])
+  datas = pd.date_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), freq='D')
+  resultados = []
+  for linhas_ponto in linhas:
+    serie = pd.Series(np.nan, index=datas)
+    if linhas_ponto:
+      coluna_tempo, coluna_valor = cabecalho.index('time'), cabecalho.index('precipitation')
+      tempo = pd.to_datetime(np.array([linha[coluna_tempo] for linha in linhas_ponto], dtype=np.int64), unit='ms').normalize()
+      valores = pd.Series(np.array([linha[coluna_valor] for linha in linhas_ponto], dtype=float), index=tempo)
+      serie = valores[~valores.index.duplicated()].reindex(datas)
+    resultados.append(pd.DataFrame({'DATA': datas.strftime('%Y-%m-%d'), 'P': serie.to_numpy()}))
+  return resultados
+
+
+def get_google_engine(latitude, longitude, start, end, janela_dias=JANELA_GOOGLE_ENGINE, cliente=None,
+                      limite_valores=LIMITE_VALORES_GOOGLE_ENGINE):
+  """
+  Precipitação diária do CHIRPS em um ponto, extraída em lote por get_google_engine_pontos().
+  :parâmetro latitude: latitude do local.
+  :parâmetro longitude: longitude do local.
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :parâmetro janela_dias: número de dias por requisição.
+  :parâmetro cliente: módulo ou objeto com a interface do Earth Engine. Padrão: ee.
+  :parâmetro limite_valores: número máximo de valores por requisição.
+  :return: dataframe com a coluna P, uma linha por dia do intervalo.
+  """
+  dataset = get_google_engine_pontos([(latitude, longitude)], start, end, janela_dias, cliente, limite_valores)[0]
+  return dataset.drop(['DATA'], axis=1)
+
+
+#Endereço e parâmetros da API diária por ponto da NASA POWER
+URL_NASA_POWER = "https://power.larc.nasa.gov/api/temporal/daily/point"
+PARAMETROS_NASA_POWER = ['T2M', 'T2M_MAX', 'T2M_MIN', 'RH2M', 'WS2M', 'ALLSKY_SFC_SW_DWN', 'TOA_SW_DWN']
+
+#Códigos HTTP repetidos com espera exponencial
+_HTTP_REPETIR = (429, 500, 502, 503, 504)
+
+
+def cria_sessao(conexoes=8):
+  """
+  Sessão HTTP com conexões reaproveitadas entre requisições e processos leves (threads).
+  :parâmetro conexoes: número máximo de conexões mantidas abertas por servidor.
+  :return: requests.Session
+  """
+  import requests
+  sessao = requests.Session()
+  adaptador = requests.adapters.HTTPAdapter(pool_connections=conexoes, pool_maxsize=conexoes)
+  sessao.mount('http://', adaptador)
+  sessao.mount('https://', adaptador)
+  return sessao
+
+
+def _limitador(intervalo_minimo):
+  """
+  Limita a taxa de requisições: cada chamada espera até que tenha passado o intervalo mínimo desde a anterior.
+  :parâmetro intervalo_minimo: intervalo mínimo entre o início de duas requisições [s].
+  :return: função sem parâmetros que bloqueia até a próxima requisição ser permitida.
+  """
+  import threading, time
+  trava = threading.Lock()
+  proxima = [0.0]
+  def espera():
+    with trava:
+      agora = time.monotonic()
+      inicio = max(agora, proxima[0])
+      proxima[0] = inicio + intervalo_minimo
+    if inicio > agora:
+      time.sleep(inicio - agora)
+  return espera
+
+
+def _requisicao_nasa_power(sessao, latitude, longitude, start, end, url_base=URL_NASA_POWER, parametros=PARAMETROS_NASA_POWER,
+                           tentativas=5, espera=1.0, timeout=30.00, limitador=None):
+  """
+  Requisição à API da NASA POWER com novas tentativas e espera exponencial em falhas temporárias.
+  :parâmetro sessao: requests.Session usada na requisição.
+  :parâmetro latitude: latitude do local.
+  :parâmetro longitude: longitude do local.
+  :parâmetro start: data de início. Formato string = 'YYYYMMdd'
+  :parâmetro end: data de final (inclusiva). Formato string = 'YYYYMMdd'
+  :parâmetro url_base: endereço da API.
+  :parâmetro parametros: lista de parâmetros solicitados.
+  :parâmetro tentativas: número máximo de tentativas.
+  :parâmetro espera: espera antes da segunda tentativa [s], dobrada a cada nova tentativa.
+  :parâmetro timeout: tempo máximo de cada requisição [s].
+  :parâmetro limitador: função chamada antes de cada requisição (ver _limitador()).
+  :return: conteúdo JSON da resposta.
+  """
+  import time, requests
+  consulta = {'parameters': ','.join(parametros), 'community': 'RE', 'longitude': longitude, 'latitude': latitude,
+              'start': start, 'end': end, 'format': 'JSON'}
+  for tentativa in range(tentativas):
+    ultima = tentativa == tentativas - 1
+    if limitador is not None:
+      limitador()
+    Instrumentacao.conta('Upload_dataset.http.requisicoes')
+    try:
+      response = sessao.get(url_base, params=consulta, verify=True, timeout=timeout)
+    except (requests.ConnectionError, requests.Timeout):
+      if ultima:
+        raise
+    else:
+      if response.status_code not in _HTTP_REPETIR or ultima:
+        response.raise_for_status()
+        return json.loads(response.content.decode('utf-8'))
+    Instrumentacao.conta('Upload_dataset.http.repeticoes')
+    time.sleep(espera * 2**tentativa)
+
+
+def get_nasa_power(latitude, longitude, start, end, sessao=None, url_base=URL_NASA_POWER, tentativas=5, espera=1.0):
+  """
+  Dados diários da NASA POWER em um ponto.
+  :parâmetro latitude: latitude do local.
+  :parâmetro longitude: longitude do local.
+  :parâmetro start: data de início. Formato string = 'YYYYMMdd'
+  :parâmetro end: data de final (inclusiva). Formato string = 'YYYYMMdd'
+  :parâmetro sessao: requests.Session reaproveitada. Se None, uma sessão é criada.
+  :parâmetro url_base: endereço da API.
+  :parâmetro tentativas: número máximo de tentativas.
+  :parâmetro espera: espera antes da segunda tentativa [s], dobrada a cada nova tentativa.
+  :return: dataframe com DATA (datetime) e os parâmetros
+  """
+  sessao = cria_sessao(1) if sessao is None else sessao
+  content = _requisicao_nasa_power(sessao, latitude, longitude, start, end, url_base, tentativas=tentativas, espera=espera)
   dataset = convert_json_dataframe(content)
   return dataset
 
 
+#Valor usado pela NASA POWER para dados ausentes
+VALOR_AUSENTE_NASA_POWER = -999
+
+
+@Instrumentacao.medido()
 def convert_json_dataframe(file_json):
-  import pandas as pd
-  final_df = pd.DataFrame()
-  df = pd.DataFrame(file_json['properties'])
-  for i in range(6):
-    new_df = pd.DataFrame(list(df['parameter'][i].items()),columns = ['DATA',df.index[i]])
-    new_df = new_df.drop(['DATA'], axis=1)
-    final_df = pd.concat([final_df, new_df], axis=1) 
-  return final_df
+  """
+  Converte a resposta JSON da NASA POWER em dataframe.
+  Todas as colunas são montadas de uma vez como vetores float, alinhadas às datas da resposta, e o valor de dado
+  ausente (VALOR_AUSENTE_NASA_POWER) é convertido em NaN.
+  :parâmetro file_json: conteúdo JSON da resposta.
+  :return: dataframe com DATA (datetime) e uma coluna por parâmetro, na ordem da resposta.
+  """
+  parametros = file_json['properties']['parameter']
+  chaves = list(next(iter(parametros.values()), {}))
+  colunas = {'DATA': pd.to_datetime(chaves, format='%Y%m%d')}
+  for nome, valores in parametros.items():
+    if list(valores) == chaves:
+      coluna = np.fromiter(valores.values(), dtype=float, count=len(chaves))
+    else:
+      coluna = np.array([valores.get(chave, np.nan) for chave in chaves], dtype=float)
+    coluna[coluna == VALOR_AUSENTE_NASA_POWER] = np.nan
+    colunas[nome] = coluna
+  return pd.DataFrame(colunas)
 
 
 def generate_date(start, number_of_days):
@@ -83,5 +249,260 @@ def get_dataset(latitude, longitude, start, end):
   data_nasa = get_nasa_power(latitude, longitude, start = date_nasa_start, end = date_nasa_end)
   data_google = get_google_engine(latitude, longitude, start, end)
   date = generate_date(start=start_datetime, number_of_days = (datetime.datetime.strptime(end, "%Y-%m-%d").date() - datetime.datetime.strptime(start, "%Y-%m-%d").date()).days)
-  dataset = pd.concat([date, data_google, data_nasa], axis=1) 
+  dataset = pd.concat([date, data_google, data_nasa.drop(['DATA'], axis=1)], axis=1)
   return dataset
+
+
+
+def _janelas_anos(start, end):
+  """
+  Divide o intervalo [start, end) em janelas de um ano civil.
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :return: lista de tuplas (início, final inclusivo) no formato 'YYYYMMdd' da NASA POWER.
+  """
+  inicio, fim = pd.Timestamp(start), pd.Timestamp(end)
+  janelas = []
+  while inicio < fim:
+    proximo = min(pd.Timestamp(year=inicio.year + 1, month=1, day=1), fim)
+    janelas.append((inicio.strftime('%Y%m%d'), (proximo - pd.Timedelta(days=1)).strftime('%Y%m%d')))
+    inicio = proximo
+  return janelas
+
+
+def _baixa_nasa_power(sessao, latitude, longitude, start, end, url_base=URL_NASA_POWER, tentativas=5, espera=1.0, limitador=None):
+  """
+  Dados diários da NASA POWER de uma janela, com a coluna DATA.
+  :parâmetro start: data de início. Formato string = 'YYYYMMdd'
+  :parâmetro end: data de final (inclusiva). Formato string = 'YYYYMMdd'
+  Demais parâmetros como em _requisicao_nasa_power().
+  :return: dataframe com DATA (datetime) e os parâmetros.
+  """
+  content = _requisicao_nasa_power(sessao, latitude, longitude, start, end, url_base, tentativas=tentativas, espera=espera,
+                                   limitador=limitador)
+  return convert_json_dataframe(content)
+
+
+#Pasta sugerida para o cache de downloads e tamanho máximo do cache [bytes]
+PASTA_CACHE_DOWNLOAD = os.path.join('Datasets', '.cache', 'downloads')
+LIMITE_CACHE_DOWNLOAD = 512 * 2**20
+
+#Versão do conteúdo do cache de downloads; séries de versões diferentes são baixadas novamente
+VERSAO_CACHE_DOWNLOAD = 3
+
+#Dias finais do intervalo já baixado que, sem dados, são pedidos de novo (a NASA POWER preenche os dias recentes
+#com atraso)
+DIAS_RECENTES_CACHE = 10
+
+#Falhas do cache separadas por até este número de dias são baixadas em uma única requisição
+DIAS_JUNCAO_FALTANTES = 30
+
+
+def chave_cache(fonte, latitude, longitude, parametros):
+  """
+  Chave de uma série no cache de downloads.
+  :parâmetro fonte: nome da fonte dos dados ('NASA_POWER' ou 'CHIRPS').
+  :parâmetro latitude: latitude do local.
+  :parâmetro longitude: longitude do local.
+  :parâmetro parametros: lista de parâmetros da série.
+  :return: sha256 em hexadecimal de (fonte, latitude, longitude, parâmetros).
+  """
+  descricao = json.dumps([VERSAO_CACHE_DOWNLOAD, fonte, round(float(latitude), 6), round(float(longitude), 6), sorted(parametros)])
+  return hashlib.sha256(descricao.encode('utf-8')).hexdigest()
+
+
+def le_cache(pasta, chave):
+  """
+  Lê uma série do cache de downloads e marca o acesso (usado na remoção dos menos usados).
+  :parâmetro pasta: pasta do cache.
+  :parâmetro chave: chave da série (ver chave_cache()).
+  :return: tupla (dataframe com DATA (datetime) e os parâmetros, lista de intervalos (início, final exclusivo) já
+           baixados no formato 'YYYY-MM-dd') ou (None, []) se a série não estiver no cache.
+  """
+  caminho = os.path.join(pasta, chave + '.npz')
+  try:
+    with np.load(caminho, allow_pickle=False) as arquivo:
+      colunas = [str(coluna) for coluna in arquivo['colunas']]
+      dataset = pd.DataFrame({coluna: arquivo['c%d' % i] for i, coluna in enumerate(colunas)})
+      baixados = [(str(inicio), str(fim)) for inicio, fim in arquivo['baixados']]
+  except (OSError, KeyError, ValueError):
+    Instrumentacao.conta('Upload_dataset.cache.falhas')
+    return None, []
+  Instrumentacao.conta('Upload_dataset.cache.acertos')
+  dataset['DATA'] = pd.to_datetime(dataset['DATA'])
+  os.utime(caminho)
+  return dataset, baixados
+
+
+def grava_cache(pasta, chave, dataset, baixados):
+  """
+  Grava uma série no cache de downloads, trocando o arquivo de uma vez.
+  :parâmetro pasta: pasta do cache.
+  :parâmetro chave: chave da série (ver chave_cache()).
+  :parâmetro dataset: dataframe com DATA (datetime) e os parâmetros.
+  :parâmetro baixados: lista de intervalos (início, final exclusivo) já baixados, no formato 'YYYY-MM-dd'.
+  """
+  os.makedirs(pasta, exist_ok=True)
+  temporario = os.path.join(pasta, chave + '.tmp.npz')
+  colunas = {'c%d' % i: dataset[coluna].to_numpy(dtype='datetime64[ns]' if coluna == 'DATA' else float)
+             for i, coluna in enumerate(dataset.columns)}
+  np.savez(temporario, colunas=np.array(dataset.columns, dtype=str), baixados=np.array(baixados, dtype=str).reshape(-1, 2),
+           **colunas)
+  os.replace(temporario, os.path.join(pasta, chave + '.npz'))
+
+
+def limpa_cache(pasta, limite_bytes=LIMITE_CACHE_DOWNLOAD):
+  """
+  Remove as séries acessadas há mais tempo até o cache ficar dentro do limite de tamanho.
+  :parâmetro pasta: pasta do cache.
+  :parâmetro limite_bytes: tamanho máximo do cache [bytes].
+  :return: lista com as chaves removidas.
+  """
+  if not os.path.isdir(pasta):
+    return []
+  arquivos = [os.path.join(pasta, nome) for nome in os.listdir(pasta) if nome.endswith('.npz')]
+  arquivos = sorted((os.stat(caminho).st_mtime, os.stat(caminho).st_size, caminho) for caminho in arquivos)
+  total = sum(tamanho for _, tamanho, _ in arquivos)
+  removidas = []
+  for _, tamanho, caminho in arquivos:
+    if total <= limite_bytes:
+      break
+    os.remove(caminho)
+    total -= tamanho
+    removidas.append(os.path.basename(caminho)[:-4])
+  return removidas
+
+
+def _faltantes(dataset, start, end, baixados, dias_recentes=DIAS_RECENTES_CACHE, juncao=DIAS_JUNCAO_FALTANTES):
+  """
+  Intervalos de dias de [start, end) que precisam ser baixados para uma série do cache: os dias fora dos intervalos
+  já baixados e, no fim do último intervalo baixado, os dias recentes com todos os parâmetros NaN (a NASA POWER
+  retorna -999 nos dias que ainda não processou). Os demais dias sem dados são falhas permanentes e não são pedidos
+  de novo. Falhas próximas são juntadas em um único intervalo, para reduzir o número de requisições.
+  :parâmetro dataset: dataframe com DATA (datetime) ou None.
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :parâmetro baixados: lista de intervalos (início, final exclusivo) já baixados, no formato 'YYYY-MM-dd'.
+  :parâmetro dias_recentes: número de dias finais do último intervalo baixado que são pedidos de novo se vazios.
+  :parâmetro juncao: falhas separadas por até este número de dias são juntadas.
+  :return: lista de tuplas (início, final exclusivo) no formato 'YYYY-MM-dd'.
+  """
+  datas = pd.date_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), freq='D')
+  ausentes = np.ones(len(datas), dtype=bool)
+  if dataset is not None:
+    for inicio, fim in baixados:
+      ausentes &= ~((datas >= pd.Timestamp(inicio)) & (datas < pd.Timestamp(fim)))
+    if baixados:
+      #------------> Dias recentes sem dados no fim do intervalo baixado
+      valores = dataset.drop(columns='DATA')
+      preenchidos = dataset['DATA'][valores.notna().any(axis=1)] if valores.shape[1] else dataset['DATA']
+      fim = max(pd.Timestamp(fim) for _, fim in baixados)
+      recentes = pd.date_range(fim - pd.Timedelta(days=dias_recentes), fim - pd.Timedelta(days=1), freq='D')
+      vazios = ~recentes.isin(preenchidos)
+      cauda = recentes[len(vazios) - np.argmin(vazios[::-1]):] if not vazios.all() else recentes
+      ausentes |= datas.isin(cauda)
+  posicoes = np.flatnonzero(ausentes)
+  if not posicoes.size:
+    return []
+  quebras = np.flatnonzero(np.diff(posicoes) > juncao + 1)
+  inicios = np.concatenate([[posicoes[0]], posicoes[quebras + 1]])
+  finais = np.concatenate([posicoes[quebras], [posicoes[-1]]])
+  return [(str(datas[a].date()), str((datas[b] + pd.Timedelta(days=1)).date())) for a, b in zip(inicios, finais)]
+
+
+def _une_intervalos(intervalos):
+  """
+  União de intervalos de datas, com os intervalos sobrepostos ou contíguos juntados.
+  :parâmetro intervalos: lista de tuplas (início, final exclusivo) no formato 'YYYY-MM-dd'.
+  :return: lista ordenada de tuplas (início, final exclusivo) no formato 'YYYY-MM-dd'.
+  """
+  uniao = []
+  for inicio, fim in sorted(intervalos):
+    if uniao and inicio <= uniao[-1][1]:
+      uniao[-1] = (uniao[-1][0], max(uniao[-1][1], fim))
+    else:
+      uniao.append((inicio, fim))
+  return uniao
+
+
+def _combina(guardado, novos):
+  """
+  Junta a série do cache com as janelas baixadas, ordenada por data.
+  :parâmetro guardado: dataframe do cache ou None.
+  :parâmetro novos: lista de dataframes baixados, com DATA (datetime).
+  :return: dataframe com DATA (datetime) e os parâmetros.
+  """
+  partes = ([] if guardado is None else [guardado]) + novos
+  dataset = pd.concat(partes, ignore_index=True)
+  dataset = dataset.drop_duplicates('DATA', keep='last').sort_values('DATA', kind='mergesort')
+  return dataset.reset_index(drop=True)
+
+
+@Instrumentacao.medido()
+def get_datasets(pontos, start, end, processos=8, tentativas=5, espera=1.0, intervalo_minimo=0.0, url_base=URL_NASA_POWER,
+                 sessao=None, chirps=True, cliente=None, pasta_cache=None, limite_cache=LIMITE_CACHE_DOWNLOAD):
+  """
+  Upload da base de dados de vários pontos, com requisições simultâneas e cache local opcional.
+  Os intervalos longos da NASA POWER são divididos em anos e as requisições (ponto x ano) são feitas por um conjunto
+  limitado de threads sobre uma única sessão HTTP, com novas tentativas e espera exponencial. A precipitação do
+  CHIRPS é extraída em lote por get_google_engine_pontos(), ao mesmo tempo, agrupando os pontos com o mesmo intervalo.
+  Com pasta_cache, cada série (fonte, latitude, longitude, parâmetros) é guardada em disco com os intervalos já
+  baixados e apenas os dias fora deles (e os dias recentes ainda sem dados, ver _faltantes()) são baixados e
+  acrescentados; as séries acessadas há mais tempo são removidas acima de limite_cache.
+  :parâmetro pontos: lista de tuplas (latitude, longitude).
+  :parâmetro start: data de início. Formato string = 'YYYY-MM-dd'
+  :parâmetro end: data de final (exclusiva). Formato string = 'YYYY-MM-dd'
+  :parâmetro processos: número máximo de requisições simultâneas.
+  :parâmetro tentativas: número máximo de tentativas por requisição.
+  :parâmetro espera: espera antes da segunda tentativa [s], dobrada a cada nova tentativa.
+  :parâmetro intervalo_minimo: intervalo mínimo entre o início de duas requisições [s].
+  :parâmetro url_base: endereço da API da NASA POWER.
+  :parâmetro sessao: requests.Session reaproveitada. Se None, uma sessão é criada.
+  :parâmetro chirps: se False, a precipitação do CHIRPS não é extraída.
+  :parâmetro cliente: módulo ou objeto com a interface do Earth Engine. Padrão: ee.
+  :parâmetro pasta_cache: pasta do cache de downloads (ex.: PASTA_CACHE_DOWNLOAD). Se None, não usa cache.
+  :parâmetro limite_cache: tamanho máximo do cache [bytes].
+  :return: lista de dataframes da base de dados (DATA, P e parâmetros da NASA POWER), um por ponto.
+  """
+  from concurrent.futures import ThreadPoolExecutor
+  sessao = cria_sessao(processos) if sessao is None else sessao
+  limitador = _limitador(intervalo_minimo) if intervalo_minimo > 0 else None
+  fontes = [('NASA_POWER', PARAMETROS_NASA_POWER)] + ([('CHIRPS', ['P'])] if chirps else [])
+  chaves = {fonte: [chave_cache(fonte, latitude, longitude, parametros) for latitude, longitude in pontos]
+            for fonte, parametros in fontes}
+  guardados = {fonte: [le_cache(pasta_cache, chave) if pasta_cache else (None, []) for chave in chaves[fonte]]
+               for fonte, _ in fontes}
+  faltam = {fonte: [_faltantes(guardado, start, end, baixados) for guardado, baixados in guardados[fonte]]
+            for fonte, _ in fontes}
+  grupos = {}
+  if chirps:
+    for i, intervalos in enumerate(faltam['CHIRPS']):
+      for intervalo in intervalos:
+        grupos.setdefault(intervalo, []).append(i)
+  with ThreadPoolExecutor(max_workers=processos + 1) as executor:
+    tarefas_chirps = {(inicio, fim): executor.submit(get_google_engine_pontos, [pontos[i] for i in indices], inicio, fim,
+                                                     cliente=cliente) for (inicio, fim), indices in grupos.items()}
+    tarefas_nasa = [[executor.submit(_baixa_nasa_power, sessao, latitude, longitude, janela_inicio, janela_fim, url_base,
+                                     tentativas, espera, limitador)
+                     for inicio, fim in faltam['NASA_POWER'][i] for janela_inicio, janela_fim in _janelas_anos(inicio, fim)]
+                    for i, (latitude, longitude) in enumerate(pontos)]
+    novos = {'NASA_POWER': [[tarefa.result() for tarefa in tarefas_ponto] for tarefas_ponto in tarefas_nasa],
+             'CHIRPS': [[] for _ in pontos]}
+    for intervalo, indices in grupos.items():
+      for i, tabela in zip(indices, tarefas_chirps[intervalo].result()):
+        tabela['DATA'] = pd.to_datetime(tabela['DATA'])
+        novos['CHIRPS'][i].append(tabela)
+  datas = pd.date_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), freq='D')
+  datasets = []
+  for i in range(len(pontos)):
+    partes = [pd.DataFrame({'DATA': datas.strftime('%Y-%m-%d')})]
+    for fonte, _ in reversed(fontes):
+      guardado, baixados = guardados[fonte][i]
+      tabela = _combina(guardado, novos[fonte][i])
+      if pasta_cache and novos[fonte][i]:
+        grava_cache(pasta_cache, chaves[fonte][i], tabela, _une_intervalos(baixados + faltam[fonte][i]))
+      partes.append(tabela.set_index('DATA').reindex(datas).reset_index(drop=True))
+    datasets.append(pd.concat(partes, axis=1))
+  if pasta_cache:
+    limpa_cache(pasta_cache, limite_cache)
+  return datasets
@@ -0,0 +1,210 @@
+"""
+Testes da extração em lote do CHIRPS (get_google_engine_pontos) com um cliente falso do Earth Engine e do download
+da NASA POWER (get_datasets) contra um servidor HTTP local.
+"""
+
+import json
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+import Upload_dataset
+
+class _Colecao:
+  """
+  ImageCollection falsa: guarda o intervalo de datas filtrado.
+  """
+
+  def __init__(self, inicio=None, fim=None):
+    self.inicio = inicio
+    self.fim = fim
+
+  def select(self, banda):
+    return self
+
+  def filterDate(self, inicio, fim):
+    return _Colecao(inicio, fim)
+
+  def getRegion(self, geometria, escala):
+    return geometria, self.inicio, self.fim
+
+class _Geometry:
+  """
+  Geometry falsa: um ponto é a tupla (longitude, latitude).
+  """
+
+  @staticmethod
+  def Point(coordenadas):
+    return tuple(coordenadas)
+
+class _ClienteFalso:
+  """
+  Interface do Earth Engine usada por get_google_engine_pontos(), com dados sintéticos: a precipitação de um dia é
+  latitude + dia do mês. Cada getInfo() registra o número de pontos e o número de valores (pontos x dias) pedidos.
+  """
+  Geometry = _Geometry
+
+  def __init__(self):
+    self.requisicoes = []
+
+  def ImageCollection(self, nome):
+    return _Colecao()
+
+  def List(self, regioes):
+    cliente = self
+    class _Lista:
+      def getInfo(self):
+        valores = sum((pd.Timestamp(fim) - pd.Timestamp(inicio)).days for _, inicio, fim in regioes)
+        cliente.requisicoes.append((len(regioes), valores))
+        return [_regiao(*regiao) for regiao in regioes]
+    return _Lista()
+
+def _regiao(geometria, inicio, fim):
+  """
+  Resposta de getRegion(): cabeçalho e uma linha por imagem (dia) da janela.
+  """
+  longitude, latitude = geometria
+  linhas = [['id', 'longitude', 'latitude', 'time', 'precipitation']]
+  for data in pd.date_range(inicio, pd.Timestamp(fim) - pd.Timedelta(days=1), freq='D'):
+    linhas.append([data.strftime('%Y%m%d'), longitude, latitude, data.value // 10**6, latitude + data.day])
+  return linhas
+
+def _pontos(n):
+  return [(float(i), -40.0 - i) for i in range(n)]
+
+def test_lotes_respeitam_limite_de_valores():
+  cliente = _ClienteFalso()
+  resultados = Upload_dataset.get_google_engine_pontos(_pontos(25), '2000-01-01', '2001-01-01', cliente=cliente,
+                                                       limite_valores=1000)
+  assert [pontos for pontos, _ in cliente.requisicoes] == [2] * 12 + [1]
+  assert max(valores for _, valores in cliente.requisicoes) <= 1000
+  assert len(resultados) == 25
+
+def test_janela_reduzida_quando_um_ponto_excede_o_limite():
+  cliente = _ClienteFalso()
+  resultado = Upload_dataset.get_google_engine_pontos(_pontos(1), '2000-01-01', '2001-01-01', cliente=cliente,
+                                                      limite_valores=100)[0]
+  assert cliente.requisicoes == [(1, 100)] * 3 + [(1, 66)]
+  assert resultado.shape[0] == 366 and not resultado['P'].isna().any()
+
+def test_valores_na_ordem_dos_pontos():
+  cliente = _ClienteFalso()
+  pontos = _pontos(7)
+  resultados = Upload_dataset.get_google_engine_pontos(pontos, '2000-01-01', '2000-03-01', janela_dias=20,
+                                                       cliente=cliente, limite_valores=50)
+  datas = pd.date_range('2000-01-01', '2000-02-29', freq='D')
+  for (latitude, _), resultado in zip(pontos, resultados):
+    assert list(resultado['DATA']) == list(datas.strftime('%Y-%m-%d'))
+    np.testing.assert_array_equal(resultado['P'].to_numpy(), latitude + datas.day.to_numpy())
+
+def test_poucos_pontos_uma_requisicao_por_janela():
+  cliente = _ClienteFalso()
+  Upload_dataset.get_google_engine_pontos(_pontos(3), '2000-01-01', '2010-01-01', cliente=cliente)
+  assert [pontos for pontos, _ in cliente.requisicoes] == [3, 3]
+
+class _NasaPowerFalsa(BaseHTTPRequestHandler):
+  """
+  API falsa da NASA POWER: o valor de cada parâmetro em um dia é latitude + dia do ano (-999 nos dias do conjunto
+  ausentes do servidor), com as datas da resposta em ordem decrescente. O servidor registra as consultas recebidas e responde com o código da função falha(consulta,
+  número de consultas anteriores iguais), quando ela não retorna None.
+  """
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    consulta = {chave: valor[0] for chave, valor in parse_qs(urlparse(self.path).query).items()}
+    with self.server.trava:
+      anteriores = self.server.consultas.count(consulta)
+      self.server.consultas.append(consulta)
+    codigo = self.server.falha(consulta, anteriores)
+    if codigo is not None:
+      self.send_response(codigo)
+      self.end_headers()
+      return
+    datas = pd.date_range(consulta['start'], consulta['end'], freq='D')[::-1]
+    valores = {data.strftime('%Y%m%d'): -999.0 if data.strftime('%Y-%m-%d') in self.server.ausentes
+               else float(consulta['latitude']) + data.dayofyear for data in datas}
+    corpo = json.dumps({'properties': {'parameter': {nome: valores for nome in consulta['parameters'].split(',')}}})
+    corpo = corpo.encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(corpo)))
+    self.end_headers()
+    self.wfile.write(corpo)
+
+@contextlib.contextmanager
+def _servidor(falha=lambda consulta, anteriores: None, ausentes=()):
+  """
+  Inicia a API falsa em uma porta livre de localhost.
+  :return: servidor, com o endereço da API em url e a lista de consultas recebidas em consultas.
+  """
+  servidor = ThreadingHTTPServer(('127.0.0.1', 0), _NasaPowerFalsa)
+  servidor.consultas, servidor.trava, servidor.falha, servidor.ausentes = [], threading.Lock(), falha, set(ausentes)
+  servidor.url = 'http://127.0.0.1:%d/api/temporal/daily/point' % servidor.server_port
+  thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+  thread.start()
+  try:
+    yield servidor
+  finally:
+    servidor.shutdown()
+    servidor.server_close()
+
+def test_nasa_power_repete_apos_503_e_junta_as_janelas_em_ordem():
+  with _servidor(lambda consulta, anteriores: 503 if anteriores == 0 else None) as servidor:
+    resultado = Upload_dataset.get_datasets([(-17.7, -40.7)], '1999-06-01', '2001-03-01', processos=3, espera=0.01,
+                                            url_base=servidor.url, chirps=False)[0]
+  janelas = sorted({(consulta['start'], consulta['end']) for consulta in servidor.consultas})
+  assert janelas == [('19990601', '19991231'), ('20000101', '20001231'), ('20010101', '20010228')]
+  assert len(servidor.consultas) == 6
+  datas = pd.date_range('1999-06-01', '2001-02-28', freq='D')
+  assert list(resultado['DATA']) == list(datas.strftime('%Y-%m-%d'))
+  for nome in Upload_dataset.PARAMETROS_NASA_POWER:
+    np.testing.assert_allclose(resultado[nome].to_numpy(), -17.7 + datas.dayofyear.to_numpy())
+
+def test_nasa_power_erro_nao_repetido():
+  with _servidor(lambda consulta, anteriores: 400) as servidor:
+    with pytest.raises(requests.HTTPError):
+      Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2000-02-01', espera=0.01, url_base=servidor.url,
+                                  chirps=False)
+  assert len(servidor.consultas) == 1
+
+def test_cache_com_falhas_internas_nao_baixa_de_novo(tmp_path):
+  pasta = str(tmp_path)
+  ausentes = pd.date_range('2000-01-05', '2000-12-31', freq='9D').strftime('%Y-%m-%d')
+  with _servidor(ausentes=ausentes) as servidor:
+    primeiro = Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2001-01-01', espera=0.01,
+                                           url_base=servidor.url, chirps=False, pasta_cache=pasta)[0]
+    assert len(servidor.consultas) == 1
+    segundo = Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2001-01-01', espera=0.01,
+                                          url_base=servidor.url, chirps=False, pasta_cache=pasta)[0]
+    assert len(servidor.consultas) == 1
+    pd.testing.assert_frame_equal(primeiro, segundo)
+    assert segundo['T2M'].isna().sum() == len(ausentes)
+    #Um mês a mais: uma única requisição, apenas com os dias novos
+    Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2001-02-01', espera=0.01, url_base=servidor.url,
+                                chirps=False, pasta_cache=pasta)
+    assert [(consulta['start'], consulta['end']) for consulta in servidor.consultas[1:]] == [('20010101', '20010131')]
+
+def test_cache_pede_de_novo_os_dias_recentes_sem_dados(tmp_path):
+  pasta = str(tmp_path)
+  with _servidor(ausentes=['2000-03-29', '2000-03-30', '2000-03-31']) as servidor:
+    Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2000-04-01', espera=0.01, url_base=servidor.url,
+                                chirps=False, pasta_cache=pasta)
+    servidor.ausentes.clear()
+    resultado = Upload_dataset.get_datasets([(-17.7, -40.7)], '2000-01-01', '2000-04-01', espera=0.01,
+                                            url_base=servidor.url, chirps=False, pasta_cache=pasta)[0]
+  assert [(consulta['start'], consulta['end']) for consulta in servidor.consultas] == [('20000101', '20000331'),
+                                                                                     ('20000329', '20000331')]
+  assert not resultado['T2M'].isna().any()
+
+def test_faltantes_proximos_em_uma_janela():
+  datas = pd.date_range('2000-01-01', '2000-03-31', freq='D')
+  guardado = pd.DataFrame({'DATA': datas, 'T2M': 1.0})
+  baixados = [('2000-01-01', '2000-02-01'), ('2000-02-11', '2000-03-01')]
+  assert Upload_dataset._faltantes(guardado, '2000-01-01', '2000-04-01', baixados) == [('2000-02-01', '2000-04-01')]
+  assert Upload_dataset._faltantes(guardado, '2000-01-01', '2000-04-01', baixados, juncao=5) == [
+    ('2000-02-01', '2000-02-11'), ('2000-03-01', '2000-04-01')]